@@ -1,13 +1,16 @@
 from telethon import TelegramClient
+from telethon.utils import get_peer_id
 
-from pytgcalls import idle
-from pytgcalls import PyTgCalls
-from pytgcalls.types import CallConfig
 import asyncio
 import os
 import configparser
 from telethon.errors import SessionPasswordNeededError, PasswordHashInvalidError
 
+from applog import get_logger
+from call_engine import ensure_started, load_pytgcalls
+
+log = get_logger("CallMeJoe")
+
 
         
         
@@ -19,17 +22,16 @@ from telethon.errors import SessionPasswordNeededError, PasswordHashInvalidError
 async def callHim(client: TelegramClient, to_username: str):
     try:
 
-        await client.get_entity(to_username)
-        call_py = PyTgCalls(client)
-        await call_py.start()
+        peer = await client.get_input_entity(to_username)
+        call_py = await ensure_started(client)
         await call_py.play(
-            chat_id=to_username,
-            stream=None, config=CallConfig())
+            chat_id=get_peer_id(peer),
+            stream=None, config=load_pytgcalls()[1]())
         
         await client.disconnect()
-        print("disconnected from session")
+        log.info("disconnected from session")
         return True
     except Exception as e:
-        print(e)
+        log.exception("callHim error", to=to_username, err=e)
         await client.disconnect()
         return False
\ No newline at end of file
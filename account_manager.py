@@ -1,12 +1,37 @@
-import os
+import time
 import asyncio
-import traceback
-import configparser
+import functools
+from contextlib import asynccontextmanager
 from telethon import TelegramClient
 from telethon.errors import SessionPasswordNeededError, PasswordHashInvalidError, PhoneCodeInvalidError, PhoneCodeExpiredError
 
+from applog import get_logger
+from call_registry import MemoryRegistry
+from client_pool import ClientPool, timed_connect, timed_is_authorized
+from flood_control import FloodControl, FloodWait
+from metrics import REGISTRY, STAGE_SECONDS, stage
+from pending_auth import PendingAuth
+from session_store import DirectoryStore, SessionStore
+
+log = get_logger("account_manager")
+
+AUTH_RESULTS = REGISTRY.counter("callmejoe_auth_results_total", "Results of AccountManager auth steps.", ["step", "status"])
+
+def _auth_step(name: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, phone: str, *args):
+            t0 = time.perf_counter()
+            res = await fn(self, phone, *args)
+            status = res.get("status")
+            STAGE_SECONDS.observe(time.perf_counter() - t0, stage=name, outcome="error" if status == "error" else "ok")
+            AUTH_RESULTS.inc(step=name, status=status)
+            return res
+        return wrapper
+    return decorator
+
 class AccountManager:
-    def __init__(self, sessions_dir: str, api_id: int, api_hash: str, device_model: str, system_version: str, app_version: str, lang_code: str, system_lang_code: str, proxy: dict | None = None):
+    def __init__(self, sessions_dir: str, api_id: int, api_hash: str, device_model: str, system_version: str, app_version: str, lang_code: str, system_lang_code: str, proxy: dict | None = None, pool_max_size: int = 64, pool_idle_timeout: float = 300.0, store: SessionStore | None = None, registry=None, node_id: str = "local", flood: FloodControl | None = None, flood_sleep_threshold: int = 60, pending_ttl: float = 600.0, pending_max_size: int = 256, pending_sweep_interval: float = 30.0):
         self.sessions_dir = sessions_dir
         self.api_id = api_id
         self.api_hash = api_hash
@@ -16,44 +41,57 @@ class AccountManager:
         self.lang_code = lang_code
         self.system_lang_code = system_lang_code
         self.proxy = proxy
-        self._lock = asyncio.Lock()
-        self._state = {}
-        os.makedirs(self.sessions_dir, exist_ok=True)
-
-    def _find_session_dir_by_phone(self, phone: str) -> str | None:
-        for name in sorted(os.listdir(self.sessions_dir)):
-            p = os.path.join(self.sessions_dir, name)
-            if not os.path.isdir(p):
-                continue
-            info_path = os.path.join(p, "info.ini")
-            if not os.path.exists(info_path):
-                continue
-            cfg = configparser.ConfigParser()
-            cfg.read(info_path, encoding="utf-8")
-            acc = cfg.get("ACCOUNT_INFO", "acc_number", fallback=None)
-            if acc and acc.strip() == phone.strip():
-                return p
-        return None
-
-    def _allocate_session_dir(self, phone: str) -> str:
-        existing = [d for d in os.listdir(self.sessions_dir) if os.path.isdir(os.path.join(self.sessions_dir, d)) and d.startswith("Session_")]
-        idx = len(existing) + 1
-        while True:
-            name = f"Session_{idx}"
-            path = os.path.join(self.sessions_dir, name)
-            if not os.path.exists(path):
-                os.makedirs(path, exist_ok=True)
-                cfg = configparser.ConfigParser()
-                cfg["ACCOUNT_INFO"] = {"acc_number": phone, "session_dir": name}
-                with open(os.path.join(path, "info.ini"), "w", encoding="utf-8") as f:
-                    cfg.write(f)
-                return path
-            idx += 1
-
-    def _client_from_dir(self, session_dir: str) -> TelegramClient:
-        session_path = os.path.join(session_dir, "telethon.session")
+        self._locks: dict[str, list] = {}
+        self._pending = PendingAuth(ttl=pending_ttl, max_size=pending_max_size)
+        self.pending_sweep_interval = pending_sweep_interval
+        self._sweeper: asyncio.Task | None = None
+        self.pool = ClientPool(self._pool_client_factory, max_size=pool_max_size, idle_timeout=pool_idle_timeout)
+        self.store = store if store is not None else DirectoryStore(sessions_dir)
+        self.registry = registry if registry is not None else MemoryRegistry()
+        self.node_id = node_id
+        self.flood = flood if flood is not None else FloodControl()
+        self.flood_sleep_threshold = flood_sleep_threshold
+
+    @asynccontextmanager
+    async def _phone_lock(self, phone: str):
+        key = phone.strip()
+        slot = self._locks.get(key)
+        if slot is None:
+            slot = [asyncio.Lock(), 0]
+            self._locks[key] = slot
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                self._locks.pop(key, None)
+
+    def list_accounts(self) -> list[tuple[str, str]]:
+        return self.store.items()
+
+    def has_account(self, phone: str) -> bool:
+        return self.store.get(phone) is not None
+
+    def read_meta(self, phone: str, section: str) -> dict | None:
+        return self.store.read_meta(phone, section)
+
+    def write_meta(self, phone: str, section: str, values: dict) -> bool:
+        return self.store.write_meta(phone, section, values)
+
+    def read_json(self, phone: str, name: str):
+        return self.store.read_json(phone, name)
+
+    def write_json(self, phone: str, name: str, data) -> bool:
+        return self.store.write_json(phone, name, data)
+
+    def _new_client(self, phone: str) -> TelegramClient | None:
+        session = self.store.telethon_session(phone)
+        if session is None:
+            return None
         client = TelegramClient(
-            session=session_path,
+            session=session,
             api_id=self.api_id,
             api_hash=self.api_hash,
             device_model=self.device_model,
@@ -61,134 +99,266 @@ class AccountManager:
             app_version=self.app_version,
             lang_code=self.lang_code,
             system_lang_code=self.system_lang_code,
-            proxy=self.proxy
+            proxy=self.proxy,
+            flood_sleep_threshold=self.flood_sleep_threshold
         )
         return client
 
+    def _flood_result(self, phone: str, e: FloodWait) -> dict:
+        log.warning("flood_wait", phone=phone, method=e.method, retry_after=e.retry_after)
+        return {"status": "flood_wait", "number": phone, "retry_after": e.retry_after}
+
+    def _pool_client_factory(self, phone: str) -> TelegramClient | None:
+        return self._new_client(phone)
+
+    async def _disconnect(self, entry: dict | None):
+        client = None if entry is None else entry.get("client")
+        if client is None:
+            return
+        try:
+            await client.disconnect()
+        except Exception as e:
+            log.warning("pending disconnect error", err=e)
+
+    async def _set_pending(self, phone: str, entry: dict):
+        old = self._pending.pop(phone)
+        if old is not None and old.get("client") is not entry["client"]:
+            await self._disconnect(old)
+        for victim, evicted in self._pending.put(phone, entry):
+            await self._disconnect(evicted)
+            self.registry.pop_auth(victim)
+
+    async def _drop_pending(self, phone: str):
+        await self._disconnect(self._pending.pop(phone))
+        self.registry.pop_auth(phone)
+
+    async def _check_expired(self, phone: str) -> dict | None:
+        entry = self._pending.expire(phone)
+        if entry is not None:
+            await self._disconnect(entry)
+        if not self._pending.was_expired(phone):
+            return None
+        self.registry.pop_auth(phone)
+        log.info("expired", phone=phone)
+        return {"status": "expired", "number": phone}
+
+    @_auth_step("init_new")
     async def init_new(self, phone: str) -> dict:
-        async with self._lock:
+        async with self._phone_lock(phone):
+            client = None
             try:
-                print(f"[AccountManager] init_new start phone={phone}")
-                session_dir = self._find_session_dir_by_phone(phone)
-                if session_dir is None:
-                    session_dir = self._allocate_session_dir(phone)
-                client = self._client_from_dir(session_dir)
-                await client.connect()
-                if await client.is_user_authorized():
-                    await client.disconnect()
-                    self._state[phone] = {"session_dir": session_dir, "authorized": True, "client": None, "code": None, "twofa": False}
-                    print(f"[AccountManager] already_authorized phone={phone}")
+                log.info("init_new start", phone=phone)
+                if not self.has_account(phone):
+                    self.store.allocate(phone)
+                if phone in self.pool:
+                    await self._drop_pending(phone)
+                    log.info("already_authorized", phone=phone, pooled=True)
                     return {"status": "already_authorized", "number": phone}
-                await client.send_code_request(phone)
-                self._state[phone] = {"session_dir": session_dir, "authorized": False, "client": client, "code": None, "twofa": False}
-                print(f"[AccountManager] code_sent phone={phone}")
+                self.flood.check(phone, "send_code_request")
+                client = self._new_client(phone)
+                await timed_connect(client)
+                if await timed_is_authorized(client):
+                    await self.pool.put(phone, client)
+                    client = None
+                    await self._drop_pending(phone)
+                    log.info("already_authorized", phone=phone)
+                    return {"status": "already_authorized", "number": phone}
+                async with self.flood.guard(phone, "send_code_request"):
+                    with stage("send_code_request"):
+                        sent = await client.send_code_request(phone)
+                await self._set_pending(phone, {"client": client, "code": None, "twofa": False})
+                client = None
+                self.registry.put_auth(phone, {"phone_code_hash": sent.phone_code_hash, "node": self.node_id, "twofa": False})
+                log.info("code_sent", phone=phone)
                 return {"status": "code_sent", "number": phone}
+            except FloodWait as e:
+                await self._disconnect({"client": client})
+                return self._flood_result(phone, e)
             except Exception as e:
-                print(f"[AccountManager] init_new error phone={phone} err={e}")
-                traceback.print_exc()
+                log.exception("init_new error", phone=phone, err=e)
+                await self._disconnect({"client": client})
                 return {"status": "error", "number": phone, "detail": str(e)}
 
+    async def _pending_client(self, phone: str, twofa: bool) -> dict | None:
+        st = self._pending.get(phone)
+        if st is not None:
+            return st
+        client = self._new_client(phone)
+        if client is None:
+            return None
+        try:
+            await timed_connect(client)
+        except BaseException:
+            await self._disconnect({"client": client})
+            raise
+        st = {"client": client, "code": None, "twofa": twofa}
+        await self._set_pending(phone, st)
+        return st
+
+    @_auth_step("enter_code")
     async def enter_code(self, phone: str, code: str) -> dict:
-        async with self._lock:
+        async with self._phone_lock(phone):
             try:
-                print(f"[AccountManager] enter_code start phone={phone}")
-                st = self._state.get(phone)
+                log.info("enter_code start", phone=phone)
+                expired = await self._check_expired(phone)
+                if expired is not None:
+                    return expired
+                self.flood.check(phone, "sign_in")
+                st = await self._pending_client(phone, twofa=False)
                 if st is None:
-                    session_dir = self._find_session_dir_by_phone(phone)
-                    if session_dir is None:
-                        print(f"[AccountManager] no_session phone={phone}")
-                        return {"status": "no_session", "number": phone}
-                    client = self._client_from_dir(session_dir)
-                    await client.connect()
-                    st = {"session_dir": session_dir, "authorized": await client.is_user_authorized(), "client": client, "code": None, "twofa": False}
-                    self._state[phone] = st
+                    log.info("no_session", phone=phone)
+                    return {"status": "no_session", "number": phone}
                 client = st["client"]
-                if client is None:
-                    client = self._client_from_dir(st["session_dir"])
-                    await client.connect()
-                    st["client"] = client
-                if await client.is_user_authorized():
-                    await client.disconnect()
-                    st["authorized"] = True
-                    st["client"] = None
-                    print(f"[AccountManager] already_authorized phone={phone}")
+                if await timed_is_authorized(client):
+                    await self.pool.put(phone, client)
+                    self._pending.pop(phone)
+                    self.registry.pop_auth(phone)
+                    log.info("already_authorized", phone=phone)
                     return {"status": "already_authorized", "number": phone}
+                pending = self.registry.get_auth(phone) or {}
                 try:
-                    await client.sign_in(phone=phone, code=code)
-                    st["authorized"] = True
-                    st["code"] = code
-                    st["twofa"] = False
-                    await client.disconnect()
-                    st["client"] = None
-                    print(f"[AccountManager] authorized phone={phone}")
+                    async with self.flood.guard(phone, "sign_in"):
+                        with stage("sign_in"):
+                            await client.sign_in(phone=phone, code=code, phone_code_hash=pending.get("phone_code_hash"))
+                    await self.pool.put(phone, client)
+                    self._pending.pop(phone)
+                    self.registry.pop_auth(phone)
+                    log.info("authorized", phone=phone)
                     return {"status": "authorized", "number": phone}
                 except SessionPasswordNeededError:
                     st["code"] = code
                     st["twofa"] = True
-                    print(f"[AccountManager] 2fa_required phone={phone}")
+                    await self._set_pending(phone, st)
+                    self.registry.put_auth(phone, {**pending, "node": self.node_id, "twofa": True})
+                    log.info("2fa_required", phone=phone)
                     return {"status": "2fa_required", "number": phone}
                 except PhoneCodeInvalidError:
-                    print(f"[AccountManager] code_invalid phone={phone}")
+                    log.info("code_invalid", phone=phone)
                     return {"status": "code_invalid", "number": phone}
                 except PhoneCodeExpiredError:
-                    print(f"[AccountManager] code_expired phone={phone}")
+                    await self._drop_pending(phone)
+                    log.info("code_expired", phone=phone)
                     return {"status": "code_expired", "number": phone}
+            except FloodWait as e:
+                return self._flood_result(phone, e)
             except Exception as e:
-                print(f"[AccountManager] enter_code error phone={phone} err={e}")
-                traceback.print_exc()
+                log.exception("enter_code error", phone=phone, err=e)
                 return {"status": "error", "number": phone, "detail": str(e)}
 
+    @_auth_step("enter_2fa")
     async def enter_2fa(self, phone: str, password: str) -> dict:
-        async with self._lock:
+        async with self._phone_lock(phone):
             try:
-                print(f"[AccountManager] enter_2fa start phone={phone}")
-                st = self._state.get(phone)
+                log.info("enter_2fa start", phone=phone)
+                expired = await self._check_expired(phone)
+                if expired is not None:
+                    return expired
+                self.flood.check(phone, "sign_in_2fa")
+                st = await self._pending_client(phone, twofa=True)
                 if st is None:
-                    session_dir = self._find_session_dir_by_phone(phone)
-                    if session_dir is None:
-                        print(f"[AccountManager] no_session phone={phone}")
-                        return {"status": "no_session", "number": phone}
-                    client = self._client_from_dir(session_dir)
-                    await client.connect()
-                    st = {"session_dir": session_dir, "authorized": await client.is_user_authorized(), "client": client, "code": None, "twofa": True}
-                    self._state[phone] = st
+                    log.info("no_session", phone=phone)
+                    return {"status": "no_session", "number": phone}
                 client = st["client"]
-                if client is None:
-                    client = self._client_from_dir(st["session_dir"])
-                    await client.connect()
-                    st["client"] = client
                 try:
-                    await client.sign_in(password=password)
-                    st["authorized"] = True
-                    st["twofa"] = False
-                    await client.disconnect()
-                    st["client"] = None
-                    print(f"[AccountManager] authorized phone={phone}")
+                    async with self.flood.guard(phone, "sign_in_2fa"):
+                        with stage("sign_in_2fa"):
+                            await client.sign_in(password=password)
+                    await self.pool.put(phone, client)
+                    self._pending.pop(phone)
+                    self.registry.pop_auth(phone)
+                    log.info("authorized", phone=phone)
                     return {"status": "authorized", "number": phone}
                 except PasswordHashInvalidError:
-                    print(f"[AccountManager] 2fa_incorrect phone={phone}")
+                    log.info("2fa_incorrect", phone=phone)
                     return {"status": "2fa_incorrect", "number": phone}
+            except FloodWait as e:
+                return self._flood_result(phone, e)
             except Exception as e:
-                print(f"[AccountManager] enter_2fa error phone={phone} err={e}")
-                traceback.print_exc()
+                log.exception("enter_2fa error", phone=phone, err=e)
                 return {"status": "error", "number": phone, "detail": str(e)}
 
     async def get_client(self, phone: str) -> TelegramClient | None:
         try:
-            print(f"[AccountManager] get_client phone={phone}")
-            session_dir = self._find_session_dir_by_phone(phone)
-            if session_dir is None:
-                print(f"[AccountManager] get_client not_found phone={phone}")
-                return None
-            client = self._client_from_dir(session_dir)
-            await client.connect()
-            if not await client.is_user_authorized():
-                await client.disconnect()
-                print(f"[AccountManager] get_client unauthorized phone={phone}")
+            log.debug("get_client", phone=phone)
+            client = await self.pool.acquire(phone)
+            if client is None:
+                log.debug("get_client unavailable", phone=phone)
                 return None
-            print(f"[AccountManager] get_client ready phone={phone}")
+            log.debug("get_client ready", phone=phone)
             return client
         except Exception as e:
-            print(f"[AccountManager] get_client error phone={phone} err={e}")
-            traceback.print_exc()
+            log.exception("get_client error", phone=phone, err=e)
+            return None
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def release_client(self, phone: str, client: TelegramClient | None = None):
+        self.pool.release(phone, client)
+
+    @asynccontextmanager
+    async def borrow_client(self, phone: str):
+        client = await self.get_client(phone)
+        try:
+            yield client
+        finally:
+            if client is not None:
+                self.release_client(phone, client)
+
+    async def check_authorized(self, phone: str) -> bool | None:
+        if phone in self._pending:
             return None
+        if phone in self.pool:
+            return await self.pool.check(phone)
+        async with self._phone_lock(phone):
+            client = self._new_client(phone)
+            if client is None:
+                return None
+            try:
+                await timed_connect(client)
+                return await timed_is_authorized(client)
+            except Exception as e:
+                log.warning("check_authorized error", phone=phone, err=e)
+                return None
+            finally:
+                await self._disconnect({"client": client})
+
+    async def sweep_pending(self) -> int:
+        swept = 0
+        for phone in self._pending.due():
+            async with self._phone_lock(phone):
+                entry = self._pending.expire(phone)
+                if entry is None:
+                    continue
+                await self._disconnect(entry)
+                self.registry.pop_auth(phone)
+                swept += 1
+        if swept:
+            log.info("pending swept", count=swept, left=len(self._pending))
+        return swept
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.pending_sweep_interval)
+            try:
+                await self.sweep_pending()
+            except Exception as e:
+                log.exception("pending sweep error", err=e)
+
+    def start(self):
+        self.pool.start()
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        for entry in self._pending.values():
+            await self._disconnect(entry)
+        await self.pool.close()
+        self.store.close()
@@ -0,0 +1,107 @@
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+from applog import get_logger
+from metrics import REGISTRY
+
+log = get_logger("admission")
+
+REJECTED = REGISTRY.counter("callmejoe_call_admission_rejected_total", "Call starts rejected by admission control.", ["reason"])
+WAIT_SECONDS = REGISTRY.histogram("callmejoe_call_admission_wait_seconds", "Time call starts waited for an admission slot.", [])
+
+class Rejected(Exception):
+    def __init__(self, code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.code = code
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = 8, per_account: int = 1, max_queue: int = 32, queue_timeout: float = 5.0):
+        self.max_concurrent = max_concurrent
+        self.per_account = per_account
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._per_key: dict[str, int] = {}
+        self._waiters: deque = deque()
+        self._avg_hold = 1.0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        backlog = (len(self._waiters) + 1) / max(1, self.max_concurrent)
+        return max(1, math.ceil(self._avg_hold * backlog))
+
+    def check(self, key: str) -> Rejected | None:
+        if self._per_key.get(key, 0) >= self.per_account:
+            return self._reject(Rejected(429, "account_busy", self.retry_after()), key)
+        if self._active >= self.max_concurrent and len(self._waiters) >= self.max_queue:
+            return self._reject(Rejected(503, "overloaded", self.retry_after()), key)
+        return None
+
+    def _reject(self, rejected: Rejected, key: str) -> Rejected:
+        REJECTED.inc(reason=rejected.reason)
+        log.warning("rejected", key=key, reason=rejected.reason, active=self._active, queued=len(self._waiters), retry_after=rejected.retry_after)
+        return rejected
+
+    def _release_slot(self):
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._active -= 1
+
+    async def _acquire_slot(self, key: str):
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject(Rejected(503, "overloaded", self.retry_after()), key)
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                self._release_slot()
+            elif fut in self._waiters:
+                self._waiters.remove(fut)
+            raise self._reject(Rejected(503, "overloaded", self.retry_after()), key)
+        except BaseException:
+            if fut.done() and not fut.cancelled():
+                self._release_slot()
+            elif fut in self._waiters:
+                self._waiters.remove(fut)
+            raise
+        finally:
+            WAIT_SECONDS.observe(time.perf_counter() - t0)
+
+    @asynccontextmanager
+    async def admit(self, key: str):
+        if self._per_key.get(key, 0) >= self.per_account:
+            raise self._reject(Rejected(429, "account_busy", self.retry_after()), key)
+        self._per_key[key] = self._per_key.get(key, 0) + 1
+        try:
+            await self._acquire_slot(key)
+            t0 = time.monotonic()
+            try:
+                yield
+            finally:
+                self._avg_hold = 0.8 * self._avg_hold + 0.2 * (time.monotonic() - t0)
+                self._release_slot()
+        finally:
+            self._per_key[key] -= 1
+            if self._per_key[key] <= 0:
+                self._per_key.pop(key, None)
@@ -1,15 +1,39 @@
 from fastapi import FastAPI, Request, status, Query
-from fastapi.responses import JSONResponse
-import traceback
-import uvicorn
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse as StdJSONResponse, ORJSONResponse, StreamingResponse, Response
+import asyncio
+import json
 import os
-import configparser
-from pytgcalls import PyTgCalls
-from pytgcalls.types import CallConfig
+import time
+from contextlib import asynccontextmanager
 
+from applog import dropped_records, get_logger, setup_logging
 from account_manager import AccountManager
+from admission import AdmissionController, Rejected
+from call_engine import CallEngine
+from call_registry import open_registry
+from call_scheduler import CallScheduler
+from cluster import FORWARDED_HEADER, Cluster
+from fastjson import dumps, orjson
+from flood_control import FloodControl, FloodWait, parse_limits
+from metrics import CONTENT_TYPE, REGISTRY, stage
+from peer_cache import PeerCache
+from profile_cache import ProfileCache
+from schemas import (
+    AuthResult, CallCancelRequest, CallCancelResult, CallScheduleRequest, CallScheduleResult, CallStartRequest, CallStartResult,
+    Enter2FARequest, EnterCodeRequest, InfoBatchRequest, InitNewRequest, ScheduledCall, ScheduledCalls, SessionInfo, SessionsBatch, SessionsList
+)
+from session_health import SessionHealth
+from session_store import open_store
+
+setup_logging()
+log = get_logger("api")
+
+JSONResponse = ORJSONResponse if orjson is not None and os.getenv("API_ORJSON", "1") != "0" else StdJSONResponse
+
+cluster = Cluster.from_env()
 
-app = FastAPI()
+registry = open_registry(os.getenv("CALL_REGISTRY", "memory"), os.getenv("CALL_REGISTRY_PATH", "registry.db"))
 
 manager = AccountManager(
     sessions_dir="sessions",
@@ -20,137 +44,522 @@ manager = AccountManager(
     app_version="1.0.0",
     lang_code="en",
     system_lang_code="en",
-    proxy=None
+    proxy=None,
+    pool_max_size=int(os.getenv("CLIENT_POOL_MAX_SIZE", "64")),
+    pool_idle_timeout=float(os.getenv("CLIENT_POOL_IDLE_TIMEOUT", "300")),
+    store=open_store(os.getenv("SESSION_STORE", "dir"), "sessions", os.getenv("SESSION_DB_PATH", "sessions.db")),
+    registry=registry,
+    node_id=cluster.node_id,
+    flood=FloodControl(parse_limits(os.getenv("FLOOD_LIMITS", "")), max_delay=float(os.getenv("FLOOD_MAX_DELAY", "2"))),
+    flood_sleep_threshold=int(os.getenv("TELEGRAM_FLOOD_SLEEP_THRESHOLD", "0")),
+    pending_ttl=float(os.getenv("AUTH_PENDING_TTL", "600")),
+    pending_max_size=int(os.getenv("AUTH_PENDING_MAX_SIZE", "256")),
+    pending_sweep_interval=float(os.getenv("AUTH_PENDING_SWEEP_INTERVAL", "30"))
+)
+
+peers = PeerCache(
+    manager,
+    ttl=float(os.getenv("PEER_CACHE_TTL", "86400")),
+    max_size=int(os.getenv("PEER_CACHE_MAX_SIZE", "256"))
+)
+
+admission = AdmissionController(
+    max_concurrent=int(os.getenv("CALL_MAX_CONCURRENT", "8")),
+    per_account=int(os.getenv("CALL_MAX_PER_ACCOUNT", "1")),
+    max_queue=int(os.getenv("CALL_QUEUE_SIZE", "32")),
+    queue_timeout=float(os.getenv("CALL_QUEUE_TIMEOUT", "5"))
+)
+
+engine = CallEngine(
+    manager,
+    peers,
+    prewarm_top=int(os.getenv("CALL_PREWARM_TOP", "0")),
+    warmup=os.getenv("CALL_ENGINE_WARMUP", "1") != "0",
+    idle_timeout=float(os.getenv("CALL_ENGINE_IDLE_TIMEOUT", "600")),
+    owns=cluster.owns
+)
+
+SESSIONS_LIST_CONCURRENCY = int(os.getenv("SESSIONS_LIST_CONCURRENCY", "16"))
+SESSIONS_PROBE_TIMEOUT = float(os.getenv("SESSIONS_PROBE_TIMEOUT", "5"))
+SESSIONS_BATCH_MAX = int(os.getenv("SESSIONS_BATCH_MAX", "500"))
+SESSIONS_STREAM_WINDOW = int(os.getenv("SESSIONS_STREAM_WINDOW", "64"))
+
+PROBE_SEMAPHORE = asyncio.Semaphore(SESSIONS_LIST_CONCURRENCY)
+
+async def _probe_session(number: str) -> dict:
+    authorized = False
+    username = None
+    first_name = None
+    manager.flood.check(number, "get_me")
+    async with manager.borrow_client(number) as client:
+        if client:
+            async with manager.flood.guard(number, "get_me"):
+                with stage("get_me"):
+                    me = await client.get_me()
+            username = me.username
+            first_name = me.first_name
+            authorized = True
+    return {"number": number, "authorized": authorized, "username": username, "first_name": first_name}
+
+profiles = ProfileCache(
+    manager,
+    _probe_session,
+    ttl=float(os.getenv("PROFILE_CACHE_TTL", "300")),
+    timeout=SESSIONS_PROBE_TIMEOUT,
+    refresh_interval=float(os.getenv("PROFILE_REFRESH_INTERVAL", "30")),
+    owns=cluster.owns
 )
 
-ACTIVE_CALLS = {}
+async def _session_revoked(number: str):
+    await profiles.refresh(number)
+
+health = SessionHealth(
+    manager,
+    interval=float(os.getenv("SESSION_HEALTH_INTERVAL", "600")),
+    batch_size=int(os.getenv("SESSION_HEALTH_BATCH", "10")),
+    batch_delay=float(os.getenv("SESSION_HEALTH_BATCH_DELAY", "5")),
+    timeout=SESSIONS_PROBE_TIMEOUT,
+    owns=cluster.owns,
+    on_revoked=_session_revoked
+)
+
+def _cached_entry(number: str) -> dict:
+    entry = profiles.get(number) or {"number": number, "authorized": None, "username": None, "first_name": None, "checked_at": None, "stale": True}
+    checked = health.get(number)
+    if checked is not None and (entry["checked_at"] is None or checked["checked_at"] >= entry["checked_at"]):
+        entry = {**entry, "authorized": checked["authorized"]}
+    return entry
+
+async def _queued_refresh(number: str) -> dict:
+    async with PROBE_SEMAPHORE:
+        return await profiles.refresh(number)
+
+async def _session_entry(number: str, refresh: bool = False) -> dict:
+    if not refresh:
+        cached = profiles.get(number)
+        if cached is not None:
+            return cached
+    try:
+        return await asyncio.wait_for(_queued_refresh(number), SESSIONS_PROBE_TIMEOUT)
+    except asyncio.TimeoutError:
+        log.warning("probe deadline", number=number)
+        return profiles.fallback(number, "timeout")
+
+async def _iter_session_entries(numbers: list[str], refresh: bool, window: int):
+    async def indexed(idx: int, number: str) -> dict:
+        return {"index": idx, **(await _session_entry(number, refresh))}
+
+    it = iter(enumerate(numbers))
+    pending = set()
+
+    def fill():
+        for idx, number in it:
+            pending.add(asyncio.ensure_future(indexed(idx, number)))
+            if len(pending) >= window:
+                return
+
+    fill()
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.discard(task)
+                yield task.result()
+            fill()
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def _remote_entries(node: str, numbers: list[str], refresh: bool) -> list[dict]:
+    try:
+        code, data = await cluster.call(node, "POST", "/sessions/info:batch", payload={"numbers": numbers, "refresh": refresh})
+        if code == status.HTTP_200_OK:
+            return data["sessions"]
+        err = (data or {}).get("status") or f"http_{code}"
+    except Exception as e:
+        log.warning("peer batch error", node=node, err=e)
+        err = "owner_unavailable"
+    return [{"number": n, "authorized": None, "username": None, "first_name": None, "checked_at": None, "stale": True, "error": err} for n in numbers]
+
+async def _gather_entries(numbers: list[str], refresh: bool, local_only: bool = False) -> list[dict]:
+    if local_only or not cluster.enabled:
+        return list(await asyncio.gather(*(_session_entry(n, refresh) for n in numbers)))
+    groups = cluster.partition(numbers)
+    local = groups.pop(cluster.node_id, [])
+    results = await asyncio.gather(
+        asyncio.gather(*(_session_entry(n, refresh) for n in local)),
+        *(_remote_entries(node, nums, refresh) for node, nums in groups.items())
+    )
+    by_number = {e["number"]: e for group in results for e in group}
+    return [by_number[n] for n in numbers]
+
+async def _iter_cluster_entries(numbers: list[str], refresh: bool, window: int):
+    if not cluster.enabled:
+        async for item in _iter_session_entries(numbers, refresh, window):
+            yield item
+        return
+    positions = {n: i for i, n in enumerate(numbers)}
+    groups = cluster.partition(numbers)
+    local = groups.pop(cluster.node_id, [])
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run_local():
+        async for item in _iter_session_entries(local, refresh, window):
+            await queue.put({**item, "index": positions[item["number"]]})
+
+    async def run_remote(node: str, nums: list[str]):
+        for entry in await _remote_entries(node, nums, refresh):
+            await queue.put({"index": positions[entry["number"]], **entry})
+
+    producers = [asyncio.ensure_future(run_local())] + [asyncio.ensure_future(run_remote(node, nums)) for node, nums in groups.items()]
+    finished = asyncio.ensure_future(asyncio.gather(*producers))
+    finished.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while (item := await queue.get()) is not None:
+            yield item
+        finished.result()
+    finally:
+        for task in producers:
+            task.cancel()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    released = registry.release_node(cluster.node_id)
+    if released:
+        log.info("released stale calls", node=cluster.node_id, count=released)
+    manager.start()
+    profiles.load()
+    profiles.start()
+    health.load()
+    health.start()
+    engine.start()
+    scheduler.load()
+    scheduler.start()
+    try:
+        yield
+    finally:
+        await scheduler.close()
+        await health.close()
+        await profiles.close()
+        await engine.close()
+        await manager.close()
+        await cluster.close()
+        registry.close()
+
+app = FastAPI(lifespan=lifespan, default_response_class=JSONResponse)
+
+HTTP_SECONDS = REGISTRY.histogram("callmejoe_http_request_seconds", "API request latency by route.", ["method", "route", "status"])
+REGISTRY.gauge("callmejoe_active_calls", "Calls currently held in the call registry.").set_function(registry.count_calls)
+REGISTRY.gauge("callmejoe_pending_auth", "Logins waiting for a code or 2FA password.").set_function(manager.pending_count)
+REGISTRY.gauge("callmejoe_sessions_authorized", "Sessions the background validator last found authorized.").set_function(health.authorized_count)
+REGISTRY.gauge("callmejoe_client_pool_size", "Connected clients held by the pool.").set_function(lambda: len(manager.pool))
+REGISTRY.gauge("callmejoe_call_engines_warm", "Accounts with a started PyTgCalls instance.").set_function(lambda: len(engine))
+REGISTRY.gauge("callmejoe_call_admission_active", "Call starts holding an admission slot.").set_function(lambda: admission.active)
+REGISTRY.gauge("callmejoe_call_admission_queue_depth", "Call starts waiting for an admission slot.").set_function(lambda: admission.queued)
+REGISTRY.gauge("callmejoe_flood_blocked", "Account and method class pairs waiting out a Telegram flood wait.").set_function(manager.flood.blocked_count)
+REGISTRY.gauge("callmejoe_scheduled_calls", "Pending scheduled calls.").set_function(lambda: len(scheduler))
+REGISTRY.gauge("callmejoe_log_dropped_records", "Log records dropped because the log queue was full.").set_function(dropped_records)
+
+KEYED_PATHS = {"/sessions/initNew", "/sessions/enterCode", "/sessions/enter2FA", "/sessions/info", "/call/start", "/call/schedule"}
+KEYED_PREFIXES = ("/call/scheduled/",)
+
+def _is_forwarded(request: Request) -> bool:
+    return FORWARDED_HEADER in request.headers
+
+@app.middleware("http")
+async def route_to_owner(request: Request, call_next):
+    keyed = request.url.path in KEYED_PATHS or request.url.path.startswith(KEYED_PREFIXES)
+    if not cluster.enabled or not keyed or _is_forwarded(request):
+        return await call_next(request)
+    number = request.query_params.get("number")
+    body = None
+    if number is None and request.method == "POST":
+        body = await request.body()
+        try:
+            number = json.loads(body).get("number")
+        except Exception:
+            number = None
+    if number is None or cluster.owns(str(number)):
+        return await call_next(request)
+    owner = cluster.owner(str(number))
+    try:
+        code, content, content_type, headers = await cluster.forward(owner, request.method, request.url.path, request.url.query, body, request.headers.get("content-type"))
+    except Exception as e:
+        log.warning("forward error", node=owner, path=request.url.path, err=e)
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "owner_unavailable", "node": owner})
+    return Response(content=content, status_code=code, media_type=content_type, headers=headers)
 
-@app.post("/sessions/initNew")
-async def init_new(request: Request):
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    t0 = time.perf_counter()
+    code = 500
     try:
-        data = await request.json()
-        number = data["number"]
-        print(f"[API] /sessions/initNew number={number}")
+        response = await call_next(request)
+        code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(time.perf_counter() - t0, method=request.method, route=getattr(route, "path", "unmatched"), status=code)
+
+@app.exception_handler(RequestValidationError)
+async def invalid_request(request: Request, exc: RequestValidationError):
+    errors = [{"loc": list(err["loc"]), "msg": err["msg"]} for err in exc.errors()]
+    return JSONResponse(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, content={"status": "invalid_request", "detail": errors})
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+def _retry_headers(res: dict) -> dict | None:
+    return {"Retry-After": str(res["retry_after"])} if res.get("retry_after") else None
+
+def _respond(response: Response, code: int, res: dict) -> dict:
+    response.status_code = code
+    headers = _retry_headers(res)
+    if headers:
+        response.headers.update(headers)
+    return res
+
+def _auth_status(res: dict) -> int:
+    return status.HTTP_429_TOO_MANY_REQUESTS if res.get("status") == "flood_wait" else status.HTTP_202_ACCEPTED
+
+async def _logged_in(number: str):
+    profiles.mark_authorized(number)
+    await health.record(number, True)
+
+@app.post("/sessions/initNew", response_model=AuthResult, response_model_exclude_unset=True, status_code=status.HTTP_202_ACCEPTED)
+async def init_new(response: Response, body: InitNewRequest):
+    try:
+        number = body.number
+        log.info("/sessions/initNew", number=number)
         res = await manager.init_new(number)
-        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=res)
+        if res.get("status") in ("authorized", "already_authorized"):
+            await _logged_in(number)
+        return _respond(response, _auth_status(res), res)
     except Exception as e:
-        print(f"[API] /sessions/initNew error err={e}")
-        traceback.print_exc()
+        log.exception("/sessions/initNew error", err=e)
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"status": "error", "detail": str(e)})
 
-@app.post("/sessions/enterCode")
-async def enter_code(request: Request):
+@app.post("/sessions/enterCode", response_model=AuthResult, response_model_exclude_unset=True, status_code=status.HTTP_202_ACCEPTED)
+async def enter_code(response: Response, body: EnterCodeRequest):
     try:
-        data = await request.json()
-        number = data["number"]
-        code = data["code"]
-        print(f"[API] /sessions/enterCode number={number} code_len={len(str(code))}")
+        number = body.number
+        code = body.code
+        log.info("/sessions/enterCode", number=number, code_len=len(code))
         res = await manager.enter_code(number, code)
-        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=res)
+        if res.get("status") in ("authorized", "already_authorized"):
+            await _logged_in(number)
+        return _respond(response, _auth_status(res), res)
     except Exception as e:
-        print(f"[API] /sessions/enterCode error err={e}")
-        traceback.print_exc()
+        log.exception("/sessions/enterCode error", err=e)
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"status": "error", "detail": str(e)})
 
-@app.post("/sessions/enter2FA")
-async def enter_2fa(request: Request):
+@app.post("/sessions/enter2FA", response_model=AuthResult, response_model_exclude_unset=True, status_code=status.HTTP_202_ACCEPTED)
+async def enter_2fa(response: Response, body: Enter2FARequest):
     try:
-        data = await request.json()
-        number = data["number"]
-        password = data["password"]
-        print(f"[API] /sessions/enter2FA number={number} pwd_len={len(str(password))}")
+        number = body.number
+        password = body.password
+        log.info("/sessions/enter2FA", number=number, pwd_len=len(password))
         res = await manager.enter_2fa(number, password)
-        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=res)
+        if res.get("status") in ("authorized", "already_authorized"):
+            await _logged_in(number)
+        return _respond(response, _auth_status(res), res)
     except Exception as e:
-        print(f"[API] /sessions/enter2FA error err={e}")
-        traceback.print_exc()
+        log.exception("/sessions/enter2FA error", err=e)
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"status": "error", "detail": str(e)})
 
-@app.get("/sessions/list")
-async def sessions_list():
+@app.get("/sessions/list", response_model=SessionsList, response_model_exclude_unset=True)
+async def sessions_list(response: Response, refresh: bool = Query(False), authorized: bool | None = Query(None)):
     try:
-        print(f"[API] /sessions/list")
-        items = []
-        os.makedirs(manager.sessions_dir, exist_ok=True)
-        for name in sorted(os.listdir(manager.sessions_dir)):
-            p = os.path.join(manager.sessions_dir, name)
-            if not os.path.isdir(p):
-                continue
-            info_path = os.path.join(p, "info.ini")
-            if not os.path.exists(info_path):
-                continue
-            cfg = configparser.ConfigParser()
-            cfg.read(info_path, encoding="utf-8")
-            number = cfg.get("ACCOUNT_INFO", "acc_number", fallback=None)
-            if not number:
-                continue
-            authorized = False
-            username = None
-            first_name = None
-            client = await manager.get_client(number)
-            if client:
-                me = await client.get_me()
-                username = me.username
-                first_name = me.first_name
-                authorized = True
-                await client.disconnect()
-            items.append({"number": number, "authorized": authorized, "username": username, "first_name": first_name})
-        return JSONResponse(status_code=status.HTTP_200_OK, content={"sessions": items})
+        log.info("/sessions/list", sample=0.1, refresh=refresh, authorized=authorized)
+        numbers = [number for number, _ in manager.list_accounts()]
+        if authorized is not None and not refresh:
+            items = list(map(_cached_entry, numbers))
+            unknown = [e["number"] for e in items if e["authorized"] is None]
+            if unknown:
+                probed = {e["number"]: e for e in await _gather_entries(unknown, False)}
+                items = [probed.get(e["number"], e) for e in items]
+            items = [e for e in items if e["authorized"] is authorized]
+            return _respond(response, status.HTTP_200_OK, {"sessions": items})
+        items = await _gather_entries(numbers, refresh)
+        if authorized is not None:
+            items = [e for e in items if e["authorized"] is authorized]
+        return _respond(response, status.HTTP_200_OK, {"sessions": items})
     except Exception as e:
-        print(f"[API] /sessions/list error err={e}")
-        traceback.print_exc()
+        log.exception("/sessions/list error", err=e)
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"status": "error", "detail": str(e)})
 
-@app.get("/sessions/info")
-async def sessions_info(number: str = Query(...)):
+@app.get("/sessions/list/stream")
+async def sessions_list_stream(refresh: bool = Query(False), format: str = Query("ndjson", pattern="^(ndjson|sse)$")):
+    log.info("/sessions/list/stream", refresh=refresh, format=format)
+    numbers = [number for number, _ in manager.list_accounts()]
+
+    async def body():
+        count = 0
+        try:
+            async for item in _iter_cluster_entries(numbers, refresh, SESSIONS_STREAM_WINDOW):
+                count += 1
+                line = dumps(item)
+                yield b"data: " + line + b"\n\n" if format == "sse" else line + b"\n"
+        except Exception as e:
+            log.exception("/sessions/list/stream error", err=e)
+            err = json.dumps({"status": "error", "detail": str(e)})
+            yield f"event: error\ndata: {err}\n\n" if format == "sse" else err + "\n"
+            return
+        if format == "sse":
+            yield f"event: end\ndata: {json.dumps({'count': count})}\n\n"
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+@app.get("/sessions/info", response_model=SessionInfo, response_model_exclude_unset=True)
+async def sessions_info(response: Response, number: str = Query(...), refresh: bool = Query(False)):
     try:
-        print(f"[API] /sessions/info number={number}")
-        authorized = False
-        username = None
-        first_name = None
-        client = await manager.get_client(number)
-        if client:
-            me = await client.get_me()
-            username = me.username
-            first_name = me.first_name
-            authorized = True
-            await client.disconnect()
-        return JSONResponse(status_code=status.HTTP_200_OK, content={"status": "ok", "number": number, "authorized": authorized, "username": username, "first_name": first_name})
+        log.info("/sessions/info", sample=0.1, number=number, refresh=refresh)
+        info = await _session_entry(number, refresh)
+        return _respond(response, status.HTTP_200_OK, {"status": "ok", **info})
     except Exception as e:
-        print(f"[API] /sessions/info error err={e}")
-        traceback.print_exc()
+        log.exception("/sessions/info error", err=e)
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"status": "error", "detail": str(e)})
 
-@app.post("/call/start")
-async def call_start(request: Request):
-    try:
-        data = await request.json()
-        number = data["number"]
-        to_username = data["username"]
-        print(f"[API] /call/start number={number} to={to_username}")
-        if number in ACTIVE_CALLS:
-            return JSONResponse(status_code=status.HTTP_409_CONFLICT, content={"status": "already_in_call", "number": number, "to": ACTIVE_CALLS[number]["to"]})
-        client = await manager.get_client(number)
-        if not client:
-            return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"status": "not_authorized", "number": number})
-        try:
-            await client.get_entity(to_username)
-            call_py = PyTgCalls(client)
-            await call_py.start()
-            await call_py.play(chat_id=to_username, stream=None, config=CallConfig())
-            ACTIVE_CALLS[number] = {"to": to_username, "pytgcalls": call_py, "client": client}
-            print(f"[API] /call/start started number={number} to={to_username}")
-            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"status": "call_started", "number": number, "to": to_username})
-        except Exception as e:
-            print(f"[API] /call/start error number={number} err={e}")
-            traceback.print_exc()
-            return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"status": "error", "detail": str(e)})
+@app.post("/sessions/info:batch", response_model=SessionsBatch, response_model_exclude_unset=True)
+async def sessions_info_batch(response: Response, request: Request, body: InfoBatchRequest):
+    try:
+        numbers = list(dict.fromkeys(body.numbers))
+        refresh = body.refresh
+        log.info("/sessions/info:batch", count=len(numbers), refresh=refresh)
+        if len(numbers) > SESSIONS_BATCH_MAX:
+            return _respond(response, status.HTTP_400_BAD_REQUEST, {"status": "too_many_numbers", "max": SESSIONS_BATCH_MAX})
+        items = await _gather_entries(numbers, refresh, local_only=_is_forwarded(request))
+        return _respond(response, status.HTTP_200_OK, {"status": "ok", "sessions": items})
     except Exception as e:
-        print(f"[API] /call/start outer error err={e}")
-        traceback.print_exc()
+        log.exception("/sessions/info:batch error", err=e)
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"status": "error", "detail": str(e)})
-    finally:
-        await client.disconnect()
+
+def _rejected(number: str, rejected: Rejected) -> tuple[int, dict]:
+    return rejected.code, {"status": rejected.reason, "number": number, "retry_after": rejected.retry_after}
+
+async def _start_call(number: str, to_username: str) -> tuple[int, dict]:
+    try:
+        async with admission.admit(number):
+            return await _claim_and_play(number, to_username)
+    except Rejected as rejected:
+        return _rejected(number, rejected)
+
+async def _claim_and_play(number: str, to_username: str) -> tuple[int, dict]:
+    existing = registry.claim_call(number, cluster.node_id, {"to": to_username})
+    if existing is not None:
+        return status.HTTP_409_CONFLICT, {"status": "already_in_call", "number": number, "to": existing.get("to")}
+    try:
+        ring_ms = await engine.play(number, to_username)
+        if ring_ms is None:
+            registry.release_call(number)
+            return status.HTTP_400_BAD_REQUEST, {"status": "not_authorized", "number": number}
+        log.info("call started", number=number, to=to_username, ring_ms=ring_ms)
+        return status.HTTP_202_ACCEPTED, {"status": "call_started", "number": number, "to": to_username, "ring_ms": round(ring_ms, 1)}
+    except FloodWait as e:
+        registry.release_call(number)
+        log.warning("call start flood wait", number=number, method=e.method, retry_after=e.retry_after)
+        return status.HTTP_429_TOO_MANY_REQUESTS, {"status": "flood_wait", "number": number, "retry_after": e.retry_after}
+    except Exception as e:
+        registry.release_call(number)
+        log.exception("call start error", number=number, err=e)
+        return status.HTTP_500_INTERNAL_SERVER_ERROR, {"status": "error", "detail": str(e)}
+
+async def _fire_scheduled(job: dict) -> dict:
+    _, res = await _start_call(job["number"], job["username"])
+    return res
+
+async def _prewarm_scheduled(job: dict):
+    await engine.prepare(job["number"], job["username"])
+
+scheduler = CallScheduler(
+    os.getenv("CALL_SCHEDULE_PATH", f"scheduled_calls.{cluster.node_id}.json" if cluster.enabled else "scheduled_calls.json"),
+    fire=_fire_scheduled,
+    prewarm=_prewarm_scheduled,
+    prewarm_lead=float(os.getenv("CALL_SCHEDULE_PREWARM_LEAD", "10"))
+)
+
+@app.post("/call/start", response_model=CallStartResult, response_model_exclude_unset=True, status_code=status.HTTP_202_ACCEPTED)
+async def call_start(response: Response, body: CallStartRequest):
+    try:
+        number = body.number
+        to_username = body.username
+        log.info("/call/start", number=number, to=to_username)
+        code, res = await _start_call(number, to_username)
+        return _respond(response, code, res)
+    except Exception as e:
+        log.exception("/call/start outer error", err=e)
+        return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"status": "error", "detail": str(e)})
+
+@app.post("/call/schedule", response_model=CallScheduleResult, response_model_exclude_unset=True, status_code=status.HTTP_202_ACCEPTED)
+async def call_schedule(response: Response, body: CallScheduleRequest):
+    try:
+        number = body.number
+        to_username = body.username
+        at = body.at if body.at is not None else time.time() + body.delay
+        log.info("/call/schedule", number=number, to=to_username, at=at)
+        cached = profiles.get(number)
+        if cached is not None and cached["authorized"] is False:
+            return _respond(response, status.HTTP_400_BAD_REQUEST, {"status": "not_authorized", "number": number})
+        if at - time.time() <= admission.queue_timeout:
+            rejected = admission.check(number)
+            if rejected is not None:
+                code, res = _rejected(number, rejected)
+                return _respond(response, code, res)
+        job = scheduler.schedule(number, to_username, at)
+        return _respond(response, status.HTTP_202_ACCEPTED, {"status": "scheduled", "job": job})
+    except Exception as e:
+        log.exception("/call/schedule error", err=e)
+        return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"status": "error", "detail": str(e)})
+
+@app.post("/call/cancel", response_model=CallCancelResult, response_model_exclude_unset=True)
+async def call_cancel(response: Response, request: Request, body: CallCancelRequest):
+    try:
+        job_id = body.id
+        log.info("/call/cancel", id=job_id)
+        job = scheduler.cancel(job_id)
+        if job is None and cluster.enabled and not _is_forwarded(request):
+            for node in cluster.peers():
+                try:
+                    code, res = await cluster.call(node, "POST", "/call/cancel", payload={"id": job_id})
+                except Exception as e:
+                    log.warning("peer cancel error", node=node, err=e)
+                    continue
+                if code == status.HTTP_200_OK:
+                    return _respond(response, code, res)
+        if job is None:
+            return _respond(response, status.HTTP_404_NOT_FOUND, {"status": "not_found", "id": job_id})
+        return _respond(response, status.HTTP_200_OK, {"status": "cancelled", "job": job})
+    except Exception as e:
+        log.exception("/call/cancel error", err=e)
+        return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"status": "error", "detail": str(e)})
+
+@app.get("/call/scheduled", response_model=ScheduledCalls, response_model_exclude_unset=True)
+async def call_scheduled(response: Response, request: Request, history: bool = Query(False)):
+    jobs = scheduler.list_jobs(include_history=history)
+    if cluster.enabled and not _is_forwarded(request):
+        for node in cluster.peers():
+            try:
+                code, res = await cluster.call(node, "GET", "/call/scheduled", params={"history": "true" if history else "false"})
+            except Exception as e:
+                log.warning("peer scheduled error", node=node, err=e)
+                continue
+            if code == status.HTTP_200_OK:
+                jobs.extend(res["jobs"])
+        jobs.sort(key=lambda job: job["at"])
+    return _respond(response, status.HTTP_200_OK, {"status": "ok", "jobs": jobs})
+
+@app.get("/call/scheduled/{job_id}", response_model=ScheduledCall, response_model_exclude_unset=True)
+async def call_scheduled_job(response: Response, job_id: str, number: str | None = Query(None)):
+    job = scheduler.get(job_id)
+    if job is None:
+        return _respond(response, status.HTTP_404_NOT_FOUND, {"status": "not_found", "id": job_id})
+    return _respond(response, status.HTTP_200_OK, {"status": "ok", "job": job})
+
+@app.get("/call/stats")
+async def call_stats():
+    return {"status": "ok", **engine.stats()}
 
 #if __name__ == "__main__":
     #print("[INFO] Starting CallMeJoe...")
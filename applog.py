@@ -0,0 +1,148 @@
+import os
+import re
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+
+REDACT_KEYS = {"code", "password", "pwd", "buf", "code_buffer", "phone_code_hash", "api_hash", "token", "bot_token"}
+_REDACT_RE = re.compile(r"(?i)\b(code|password|pwd|buf|code_buffer|phone_code_hash|api_hash|token)(['\"]?\s*[=:]\s*['\"]?)([^\s,'\"}]+)")
+_MASK = "***"
+
+_listener: logging.handlers.QueueListener | None = None
+_handler: logging.Handler | None = None
+
+def redact(key: str, value):
+    if key.lower() in REDACT_KEYS and value not in (None, ""):
+        return _MASK
+    return value
+
+def scrub(text: str) -> str:
+    return _REDACT_RE.sub(lambda m: m.group(1) + m.group(2) + _MASK, text)
+
+class KVLogger:
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger
+
+    @property
+    def name(self) -> str:
+        return self._logger.name
+
+    def is_enabled_for(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level: int, event: str, kv: dict, sample: float | None = None, exc_info: bool = False):
+        if not self._logger.isEnabledFor(level):
+            return
+        if sample is not None and sample < 1.0 and random.random() >= sample:
+            return
+        kv = {k: redact(k, v) for k, v in kv.items()}
+        if sample is not None and sample < 1.0:
+            kv["sample"] = sample
+        self._logger.log(level, event, exc_info=exc_info, extra={"kv": kv}, stacklevel=3)
+
+    def debug(self, event: str, sample: float | None = None, **kv):
+        self._log(logging.DEBUG, event, kv, sample)
+
+    def info(self, event: str, sample: float | None = None, **kv):
+        self._log(logging.INFO, event, kv, sample)
+
+    def warning(self, event: str, sample: float | None = None, **kv):
+        self._log(logging.WARNING, event, kv, sample)
+
+    def error(self, event: str, sample: float | None = None, **kv):
+        self._log(logging.ERROR, event, kv, sample)
+
+    def exception(self, event: str, **kv):
+        self._log(logging.ERROR, event, kv, exc_info=True)
+
+def get_logger(name: str) -> KVLogger:
+    return KVLogger(logging.getLogger(name))
+
+def _fmt_value(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.3f}".rstrip("0").rstrip(".")
+    text = str(value)
+    if not text or any(c in text for c in " =\"\n"):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+class KVFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        ts = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}"
+        parts = [ts, record.levelname, f"[{record.name}]", scrub(record.getMessage())]
+        for k, v in (getattr(record, "kv", None) or {}).items():
+            parts.append(f"{k}={_fmt_value(v)}")
+        line = " ".join(parts)
+        if record.exc_info:
+            line += "\n" + scrub(self.formatException(record.exc_info))
+        return line
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name, "event": scrub(record.getMessage())}
+        for k, v in (getattr(record, "kv", None) or {}).items():
+            data[k] = v if isinstance(v, (int, float, bool)) or v is None else str(v)
+        if record.exc_info:
+            data["exc"] = scrub(self.formatException(record.exc_info))
+        return json.dumps(data, ensure_ascii=False)
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _NonBlockingQueueHandler.dropped += 1
+
+def _parse_levels(spec: str) -> dict[str, int]:
+    levels = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+def setup_logging(level: str | None = None, levels: str | None = None, fmt: str | None = None, queue_size: int | None = None):
+    global _listener, _handler
+    if _listener is not None:
+        return
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    levels = levels if levels is not None else os.getenv("LOG_LEVELS", "")
+    fmt = fmt or os.getenv("LOG_FORMAT", "kv")
+    queue_size = queue_size if queue_size is not None else int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JSONFormatter() if fmt == "json" else KVFormatter())
+    log_queue = queue.Queue(maxsize=queue_size)
+    _handler = _NonBlockingQueueHandler(log_queue)
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(_handler)
+    root.setLevel(logging.getLevelName(level.upper()))
+    for name, lvl in _parse_levels(levels).items():
+        logging.getLogger(name).setLevel(lvl)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def dropped_records() -> int:
+    return _NonBlockingQueueHandler.dropped
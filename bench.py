@@ -0,0 +1,362 @@
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from urllib.parse import urlencode
+from types import SimpleNamespace
+from telethon.errors import PasswordHashInvalidError, PhoneCodeInvalidError, SessionPasswordNeededError
+from telethon.tl.types import InputPeerUser
+
+FAKE_CODE = "12345"
+FAKE_PASSWORD = "hunter2"
+
+AUTHORIZED: set[str] = set()
+TWOFA: set[str] = set()
+
+class FakeConfig:
+    def __init__(self):
+        self.latency_ms = 20.0
+        self.jitter_ms = 5.0
+        self.failure_rate = 0.0
+        self.rng = random.Random(0)
+
+    async def delay(self, op: str):
+        ms = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms))
+        await asyncio.sleep(ms / 1000)
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            raise ConnectionError(f"fake {op} failure")
+
+FAKE = FakeConfig()
+
+def _session_key(session) -> str:
+    return getattr(session, "phone", None) or str(session)
+
+def _uid(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8")) & 0x7FFFFFFF
+
+class FakeTelegramClient:
+    def __init__(self, session, api_id=None, api_hash=None, **kwargs):
+        self.session_path = _session_key(session)
+        self.session = SimpleNamespace(process_entities=lambda tlo: None)
+        self._connected = False
+
+    async def connect(self):
+        await FAKE.delay("connect")
+        self._connected = True
+
+    async def disconnect(self):
+        self._connected = False
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def is_user_authorized(self) -> bool:
+        await FAKE.delay("is_user_authorized")
+        return self.session_path in AUTHORIZED
+
+    async def get_me(self, input_peer: bool = False):
+        await FAKE.delay("get_me")
+        if self.session_path not in AUTHORIZED:
+            return None
+        uid = _uid(self.session_path)
+        if input_peer:
+            return InputPeerUser(user_id=uid, access_hash=uid)
+        return SimpleNamespace(id=uid, username=f"bench{uid}", first_name="Bench")
+
+    async def send_code_request(self, phone: str):
+        await FAKE.delay("send_code_request")
+        return SimpleNamespace(phone_code_hash=f"{_uid(phone):x}")
+
+    async def sign_in(self, phone: str | None = None, code: str | None = None, password: str | None = None, phone_code_hash: str | None = None):
+        await FAKE.delay("sign_in")
+        if password is not None:
+            if password != FAKE_PASSWORD:
+                raise PasswordHashInvalidError(request=None)
+        else:
+            if code != FAKE_CODE:
+                raise PhoneCodeInvalidError(request=None)
+            if phone in TWOFA:
+                raise SessionPasswordNeededError(request=None)
+        AUTHORIZED.add(self.session_path)
+
+    async def get_input_entity(self, target: str):
+        await FAKE.delay("get_input_entity")
+        uid = _uid(target.lstrip("@").lower())
+        return InputPeerUser(user_id=uid, access_hash=uid)
+
+class FakePyTgCalls:
+    def __init__(self, client):
+        self.client = client
+
+    async def start(self):
+        await FAKE.delay("pytgcalls_start")
+
+    async def play(self, chat_id, stream=None, config=None):
+        await FAKE.delay("play")
+
+def _pct(samples: list[float], p: float) -> float | None:
+    if not samples:
+        return None
+    return round(samples[min(len(samples) - 1, int(p * len(samples)))], 2)
+
+def summarize(latencies: list[float], errors: int, wall: float) -> dict:
+    samples = sorted(latencies)
+    return {
+        "n": len(samples),
+        "errors": errors,
+        "p50_ms": _pct(samples, 0.50),
+        "p99_ms": _pct(samples, 0.99),
+        "mean_ms": round(sum(samples) / len(samples), 2) if samples else None,
+        "throughput_rps": round(len(samples) / wall, 1) if wall > 0 else None,
+    }
+
+async def measure(op, total: int, concurrency: int) -> tuple[list[float], int, float]:
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                ok = await op(i)
+            except Exception:
+                ok = False
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if not ok:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return latencies, errors, time.perf_counter() - t0
+
+async def run_case(op, total: int, concurrency: int) -> dict:
+    return summarize(*(await measure(op, total, concurrency)))
+
+async def asgi_request(app, method: str, path: str, query: str = "", body: dict | None = None) -> tuple[int, bytes]:
+    payload = b"" if body is None else json.dumps(body).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "query_string": query.encode("ascii"),
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode("ascii"))],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    done = asyncio.Event()
+    sent = False
+    status = 0
+    chunks = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    done.set()
+    return status, b"".join(chunks)
+
+def seed_sessions(api, phones: list[str], count: int):
+    while len(phones) < count:
+        phone = f"+1555{len(phones):07d}"
+        api.manager.store.allocate(phone)
+        AUTHORIZED.add(_session_key(api.manager.store.telethon_session(phone)))
+        phones.append(phone)
+
+async def bench_list(api, phones: list[str], sizes: list[int], iterations: int) -> dict:
+    results = {}
+    for size in sizes:
+        seed_sessions(api, phones, size)
+
+        def op(refresh: bool):
+            async def call(i: int) -> bool:
+                code, body = await asgi_request(api.app, "GET", "/sessions/list", "refresh=true" if refresh else "")
+                return code == 200 and len(json.loads(body)["sessions"]) == size
+            return call
+
+        results[f"sessions_list_{size}_refresh"] = await run_case(op(True), iterations, 1)
+        results[f"sessions_list_{size}_cached"] = await run_case(op(False), iterations, 1)
+    return results
+
+async def bench_info(api, phones: list[str], total: int, concurrency: int) -> dict:
+    async def op(i: int) -> bool:
+        code, body = await asgi_request(api.app, "GET", "/sessions/info", urlencode({"number": phones[i % len(phones)], "refresh": "true"}))
+        return code == 200 and json.loads(body).get("authorized") is True
+    return {"sessions_info_concurrent": await run_case(op, total, concurrency)}
+
+async def bench_auth(api, total: int, concurrency: int) -> dict:
+    manager = api.manager
+
+    async def op(i: int) -> bool:
+        phone = f"+1666{i:07d}"
+        if i % 4 == 3:
+            TWOFA.add(phone)
+        if (await manager.init_new(phone))["status"] != "code_sent":
+            return False
+        status = (await manager.enter_code(phone, FAKE_CODE))["status"]
+        if status == "2fa_required":
+            status = (await manager.enter_2fa(phone, FAKE_PASSWORD))["status"]
+        return status == "authorized"
+    return {"auth_flow_concurrent": await run_case(op, total, concurrency)}
+
+async def bench_calls(api, phones: list[str], burst: int, bursts: int) -> dict:
+    numbers = phones[:burst]
+
+    async def op(i: int) -> bool:
+        code, _ = await asgi_request(api.app, "POST", "/call/start", body={"number": numbers[i], "username": f"@target{i}"})
+        return code == 202
+
+    api.registry.release_node(api.cluster.node_id)
+    results = {"call_start_burst_cold": await run_case(op, len(numbers), len(numbers))}
+    latencies, errors, wall = [], 0, 0.0
+    for _ in range(bursts - 1):
+        api.registry.release_node(api.cluster.node_id)
+        lat, err, w = await measure(op, len(numbers), len(numbers))
+        latencies += lat
+        errors += err
+        wall += w
+    if latencies:
+        results["call_start_burst_warm"] = summarize(latencies, errors, wall)
+    api.registry.release_node(api.cluster.node_id)
+    return results
+
+async def bench_encode(sizes: list[int], iterations: int) -> dict:
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from fastjson import orjson
+    classes = {"stdlib": JSONResponse}
+    if orjson is not None:
+        classes["orjson"] = ORJSONResponse
+    results = {}
+    for size in sizes:
+        content = {"sessions": [
+            {"number": f"+1555{i:07d}", "authorized": True, "username": f"bench{i}", "first_name": "Bench", "checked_at": 1700000000.0 + i, "stale": False}
+            for i in range(size)
+        ]}
+        for name, cls in classes.items():
+            async def op(i: int) -> bool:
+                return len(cls(content=content).body) > 0
+            results[f"encode_sessions_{size}_{name}"] = await run_case(op, iterations, 1)
+    return results
+
+async def run(args) -> dict:
+    import account_manager
+    import call_engine
+    account_manager.TelegramClient = FakeTelegramClient
+    call_engine.PyTgCalls = FakePyTgCalls
+    call_engine.CallConfig = SimpleNamespace
+    import api
+
+    phones = []
+    results = {}
+    async with api.app.router.lifespan_context(api.app):
+        results.update(await bench_list(api, phones, args.sizes, args.iterations))
+        results.update(await bench_info(api, phones, args.requests, args.concurrency))
+        results.update(await bench_auth(api, args.auth_flows, args.concurrency))
+        results.update(await bench_calls(api, phones, min(args.burst, len(phones)), args.bursts))
+    results.update(await bench_encode(args.sizes, args.iterations * 10))
+    return results
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    regressed = False
+    print(f"{'case':<34} {'p50 ms':>18} {'p99 ms':>18} {'rps':>16}", file=sys.stderr)
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"{name:<34} (new)", file=sys.stderr)
+            continue
+        flag = ""
+        if base["p99_ms"] and cur["p99_ms"] and cur["p99_ms"] > base["p99_ms"] * (1 + threshold):
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{name:<34} {base['p50_ms']:>8} -> {cur['p50_ms']:<8} {base['p99_ms']:>8} -> {cur['p99_ms']:<8} {base['throughput_rps']:>7} -> {cur['throughput_rps']:<7}{flag}", file=sys.stderr)
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline CallMeJoe benchmark against fake Telethon/PyTgCalls clients.")
+    parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=[10, 100, 1000])
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--auth-flows", type=int, default=200)
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--store", choices=("dir", "sqlite"), default="dir", help="session store backend to benchmark")
+    parser.add_argument("--output", help="write results JSON here instead of stdout")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative p99 growth before --compare fails")
+    args = parser.parse_args()
+
+    FAKE.latency_ms = args.latency_ms
+    FAKE.jitter_ms = args.jitter_ms
+    FAKE.failure_rate = args.failure_rate
+    FAKE.rng = random.Random(args.seed)
+
+    os.environ["SESSION_STORE"] = args.store
+    os.environ.setdefault("LOG_LEVEL", "CRITICAL")
+    os.environ.setdefault("PROFILE_REFRESH_INTERVAL", "3600")
+    os.environ.setdefault("SESSION_HEALTH_INTERVAL", "0")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="callmejoe-bench-") as workdir:
+        os.chdir(workdir)
+        try:
+            results = asyncio.run(run(args))
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "meta": {"commit": _git_commit(), "python": platform.python_version(), "created_at": round(time.time(), 3), "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")}},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(baseline, report, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
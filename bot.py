@@ -1,27 +1,55 @@
 import os
 import re
+import time
 import asyncio
-import logging
+import functools
 from typing import List, Dict, Any
-import aiohttp
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.state import StatesGroup, State
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
+from applog import get_logger, setup_logging
 from bot_api_client import CallMeJoeAPI
+from bot_edits import EditDebouncer
+from bot_metrics import HandlerTimingMiddleware, UpdateTimingMiddleware, add_metrics_route, start_metrics_server
+from bot_storage import make_isolation, make_storage
 
-logging.basicConfig(level=logging.INFO)
+log = get_logger("bot")
+
+setup_logging()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 API_BASE = os.getenv("API_BASE", "")
+CALL_DELAY = int(os.getenv("CALL_DELAY", "30"))
+CALL_RESULT_POLL = float(os.getenv("CALL_RESULT_POLL", "3"))
+CALL_RESULT_TIMEOUT = float(os.getenv("CALL_RESULT_TIMEOUT", "60"))
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "0"))
+CODE_EDIT_DEBOUNCE = float(os.getenv("CODE_EDIT_DEBOUNCE", "0.3"))
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+BOT_WEBHOOK_URL = os.getenv("BOT_WEBHOOK_URL", "").rstrip("/")
+BOT_WEBHOOK_PATH = os.getenv("BOT_WEBHOOK_PATH", "/webhook")
+BOT_WEBHOOK_SECRET = os.getenv("BOT_WEBHOOK_SECRET", "")
+BOT_WEBHOOK_HOST = os.getenv("BOT_WEBHOOK_HOST", "0.0.0.0")
+BOT_WEBHOOK_PORT = int(os.getenv("BOT_WEBHOOK_PORT", "8080"))
+BOT_WEBHOOK_REGISTER = os.getenv("BOT_WEBHOOK_REGISTER", "1") != "0"
 
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
-api = CallMeJoeAPI(API_BASE)
+storage = make_storage(os.getenv("BOT_FSM_STORAGE", "memory"), os.getenv("BOT_FSM_PATH", "bot_fsm.db"))
+dp = Dispatcher(storage=storage, events_isolation=make_isolation(os.getenv("BOT_EVENT_ISOLATION", "memory"), os.getenv("BOT_LOCK_DIR", "bot_locks")))
+dp.update.outer_middleware(UpdateTimingMiddleware(BOT_MODE))
+api = CallMeJoeAPI(
+    API_BASE,
+    uds=os.getenv("API_UDS") or None,
+    limit=int(os.getenv("API_POOL_LIMIT", "64")),
+    retries=int(os.getenv("API_RETRIES", "2"))
+)
+edits = EditDebouncer(CODE_EDIT_DEBOUNCE)
+dp.message.middleware(HandlerTimingMiddleware())
+dp.callback_query.middleware(HandlerTimingMiddleware())
 
 class AddSessionStates(StatesGroup):
     waiting_phone = State()
@@ -31,6 +59,7 @@ class AddSessionStates(StatesGroup):
 class CallStates(StatesGroup):
     waiting_username = State()
 
+@functools.cache
 def start_keyboard():
     kb = InlineKeyboardBuilder()
     kb.button(text="Меню сессий", callback_data="menu:sessions")
@@ -70,7 +99,8 @@ def call_sessions_keyboard(items: List[Dict[str, Any]]):
     kb.adjust(1)
     return kb.as_markup()
 
-def code_keyboard(current):
+@functools.cache
+def code_keyboard():
     kb = InlineKeyboardBuilder()
     for row in (("1", "2", "3"), ("4", "5", "6"), ("7", "8", "9")):
         for d in row:
@@ -85,40 +115,27 @@ def code_keyboard(current):
     kb.adjust(2)
     return kb.as_markup()
 
-async def api_call_start(number: str, username: str) -> Dict[str, Any]:
-    url = f"{API_BASE}/call/start"
-    payload = {"number": number, "username": username}
-    print(f"[BOT] POST {url} {payload}")
-    async with aiohttp.ClientSession() as s:
-        async with s.post(url, json=payload) as r:
-            txt = await r.text()
-            print(f"[BOT] {r.status} {txt}")
-            try:
-                return {"http": r.status, **(await r.json())}
-            except Exception:
-                return {"http": r.status, "raw": txt}
-
 @dp.message(Command("start"))
 async def start(message: types.Message, state: FSMContext):
-    print(f"[BOT] /start from={message.from_user.id}")
+    log.info("/start", user=message.from_user.id)
     await state.clear()
     await message.answer("Выберите действие:", reply_markup=start_keyboard())
 
 @dp.callback_query(F.data == "back:home")
 async def back_home(call: types.CallbackQuery, state: FSMContext):
-    print(f"[BOT] back_home from={call.from_user.id}")
+    log.info("back_home", user=call.from_user.id)
     await state.clear()
     await call.message.edit_text("Выберите действие:", reply_markup=start_keyboard())
 
 @dp.callback_query(F.data == "menu:sessions")
 async def menu_sessions(call: types.CallbackQuery, state: FSMContext):
-    print(f"[BOT] open sessions menu from={call.from_user.id}")
+    log.info("open sessions menu", user=call.from_user.id)
     sessions = await api.list_sessions()
     await call.message.edit_text("Сессии:", reply_markup=sessions_keyboard(sessions))
 
 @dp.callback_query(F.data == "sessions:add")
 async def sessions_add(call: types.CallbackQuery, state: FSMContext):
-    print(f"[BOT] sessions_add start from={call.from_user.id}")
+    log.info("sessions_add start", user=call.from_user.id)
     await state.set_state(AddSessionStates.waiting_phone)
     await state.update_data(new_phone=None, code_buffer="")
     await call.message.edit_text("Введите номер телефона в международном формате. Пример: +380XXXXXXXXX")
@@ -126,13 +143,13 @@ async def sessions_add(call: types.CallbackQuery, state: FSMContext):
 @dp.message(AddSessionStates.waiting_phone)
 async def input_phone(message: types.Message, state: FSMContext):
     phone = message.text.strip()
-    print(f"[BOT] input_phone from={message.from_user.id} phone={phone}")
+    log.info("input_phone", user=message.from_user.id, phone=phone)
     if not re.fullmatch(r"\+\d{10,15}", phone):
         await message.answer("Неверный формат. Пример: +380XXXXXXXXX")
         return
     await state.update_data(new_phone=phone, code_buffer="")
     res = await api.init_new(phone)
-    print(f"[BOT] init_new result phone={phone} res={res}")
+    log.info("init_new result", phone=phone, status=res.get("status"))
     st = res.get("status")
     if st == "already_authorized":
         await state.clear()
@@ -141,7 +158,12 @@ async def input_phone(message: types.Message, state: FSMContext):
         return
     if st == "code_sent":
         await state.set_state(AddSessionStates.waiting_code)
-        await message.answer(f"Код отправлен на {phone}. Введите код через клавиатуру ниже.\nКод: ", reply_markup=code_keyboard(""))
+        await message.answer(f"Код отправлен на {phone}. Введите код через клавиатуру ниже.\nКод: ", reply_markup=code_keyboard())
+        return
+    if st == "flood_wait":
+        await state.clear()
+        sessions = await api.list_sessions()
+        await message.answer(f"Telegram ограничил запросы для {phone}. Повторите через {res.get('retry_after', 1)} сек.", reply_markup=sessions_keyboard(sessions))
         return
     await state.clear()
     sessions = await api.list_sessions()
@@ -157,8 +179,8 @@ async def code_add_digit(call: types.CallbackQuery, state: FSMContext):
         return
     buf += d
     await state.update_data(code_buffer=buf)
-    print(f"[BOT] code_add_digit user={call.from_user.id} buf={buf}")
-    await call.message.edit_text(f"Код: {buf}", reply_markup=code_keyboard(buf))
+    log.debug("code_add_digit", sample=0.1, user=call.from_user.id, code_len=len(buf))
+    edits.schedule(call.message, f"Код: {buf}", reply_markup=code_keyboard())
 
 @dp.callback_query(AddSessionStates.waiting_code, F.data == "code:del")
 async def code_del(call: types.CallbackQuery, state: FSMContext):
@@ -166,65 +188,73 @@ async def code_del(call: types.CallbackQuery, state: FSMContext):
     buf = data.get("code_buffer", "")
     buf = buf[:-1] if buf else ""
     await state.update_data(code_buffer=buf)
-    print(f"[BOT] code_del user={call.from_user.id} buf={buf}")
-    await call.message.edit_text(f"Код: {buf}", reply_markup=code_keyboard(buf))
+    log.debug("code_del", sample=0.1, user=call.from_user.id, code_len=len(buf))
+    edits.schedule(call.message, f"Код: {buf}", reply_markup=code_keyboard())
 
 @dp.callback_query(AddSessionStates.waiting_code, F.data == "code:clear")
 async def code_clear(call: types.CallbackQuery, state: FSMContext):
     await state.update_data(code_buffer="")
-    print(f"[BOT] code_clear user={call.from_user.id}")
-    await call.message.edit_text("Код: ", reply_markup=code_keyboard(""))
+    log.debug("code_clear", user=call.from_user.id)
+    edits.schedule(call.message, "Код: ", reply_markup=code_keyboard())
 
 @dp.callback_query(AddSessionStates.waiting_code, F.data == "code:cancel")
 async def code_cancel(call: types.CallbackQuery, state: FSMContext):
-    print(f"[BOT] code_cancel user={call.from_user.id}")
+    log.info("code_cancel", user=call.from_user.id)
     await state.clear()
     sessions = await api.list_sessions()
-    await call.message.edit_text("Сессии:", reply_markup=sessions_keyboard(sessions))
+    await edits.edit_now(call.message, "Сессии:", reply_markup=sessions_keyboard(sessions))
 
 @dp.callback_query(AddSessionStates.waiting_code, F.data == "code:ok")
 async def code_submit(call: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
     phone = data.get("new_phone")
     buf = data.get("code_buffer", "")
-    print(f"[BOT] code_submit user={call.from_user.id} phone={phone} code={buf}")
+    log.info("code_submit", user=call.from_user.id, phone=phone, code_len=len(buf))
     if not buf or len(buf) < 4:
         await call.answer("Слишком короткий код")
         return
     res = await api.enter_code(phone, buf)
-    print(f"[BOT] enter_code result phone={phone} res={res}")
+    log.info("enter_code result", phone=phone, status=res.get("status"))
     st = res.get("status")
     if st == "authorized":
         await state.clear()
         sessions = await api.list_sessions()
-        await call.message.edit_text(f"Авторизовано: {phone}", reply_markup=sessions_keyboard(sessions))
+        await edits.edit_now(call.message, f"Авторизовано: {phone}", reply_markup=sessions_keyboard(sessions))
         return
     if st == "2fa_required":
         await state.set_state(AddSessionStates.waiting_2fa)
-        await call.message.edit_text("Требуется пароль 2FA. Отправьте пароль текстом.")
+        await edits.edit_now(call.message, "Требуется пароль 2FA. Отправьте пароль текстом.")
         return
     if st == "code_invalid":
         await state.update_data(code_buffer="")
-        await call.message.edit_text("Неверный код. Введите снова.\nКод: ", reply_markup=code_keyboard(""))
+        await edits.edit_now(call.message, "Неверный код. Введите снова.\nКод: ", reply_markup=code_keyboard())
         return
     if st == "code_expired":
         await state.update_data(code_buffer="")
         sessions = await api.list_sessions()
-        await call.message.edit_text("Срок кода истёк. Запросите новый через /start -> Меню сессий -> Добавить новую.", reply_markup=sessions_keyboard(sessions))
+        await edits.edit_now(call.message, "Срок кода истёк. Запросите новый через /start -> Меню сессий -> Добавить новую.", reply_markup=sessions_keyboard(sessions))
+        await state.clear()
+        return
+    if st == "expired":
         await state.clear()
+        sessions = await api.list_sessions()
+        await edits.edit_now(call.message, "Время входа истекло. Начните заново через Меню сессий -> Добавить новую.", reply_markup=sessions_keyboard(sessions))
+        return
+    if st == "flood_wait":
+        await call.answer(f"Слишком много попыток. Повторите через {res.get('retry_after', 1)} сек.", show_alert=True)
         return
     await state.clear()
     sessions = await api.list_sessions()
-    await call.message.edit_text(f"Ошибка: {res.get('detail','unknown')}", reply_markup=sessions_keyboard(sessions))
+    await edits.edit_now(call.message, f"Ошибка: {res.get('detail','unknown')}", reply_markup=sessions_keyboard(sessions))
 
 @dp.message(AddSessionStates.waiting_2fa)
 async def input_2fa(message: types.Message, state: FSMContext):
     data = await state.get_data()
     phone = data.get("new_phone")
     password = message.text
-    print(f"[BOT] input_2fa user={message.from_user.id} phone={phone}")
+    log.info("input_2fa", user=message.from_user.id, phone=phone)
     res = await api.enter_2fa(phone, password)
-    print(f"[BOT] enter_2fa result phone={phone} res={res}")
+    log.info("enter_2fa result", phone=phone, status=res.get("status"))
     st = res.get("status")
     if st == "authorized":
         await state.clear()
@@ -234,6 +264,14 @@ async def input_2fa(message: types.Message, state: FSMContext):
     if st == "2fa_incorrect":
         await message.answer("Неверный пароль 2FA. Повторите.")
         return
+    if st == "expired":
+        await state.clear()
+        sessions = await api.list_sessions()
+        await message.answer("Время входа истекло. Начните заново через Меню сессий -> Добавить новую.", reply_markup=sessions_keyboard(sessions))
+        return
+    if st == "flood_wait":
+        await message.answer(f"Слишком много попыток. Отправьте пароль снова через {res.get('retry_after', 1)} сек.")
+        return
     await state.clear()
     sessions = await api.list_sessions()
     await message.answer(f"Ошибка: {res.get('detail','unknown')}", reply_markup=sessions_keyboard(sessions))
@@ -241,7 +279,7 @@ async def input_2fa(message: types.Message, state: FSMContext):
 @dp.callback_query(F.data.startswith("sessions:one:"))
 async def session_one(call: types.CallbackQuery, state: FSMContext):
     phone = call.data.split(":", 2)[-1]
-    print(f"[BOT] session_one from={call.from_user.id} phone={phone}")
+    log.info("session_one", user=call.from_user.id, phone=phone)
     info = await api.session_info(phone)
     status_text = "Неизвестно"
     if info.get("status") == "ok":
@@ -260,51 +298,140 @@ async def session_one(call: types.CallbackQuery, state: FSMContext):
 
 @dp.callback_query(F.data == "menu:call")
 async def menu_call(call: types.CallbackQuery, state: FSMContext):
-    print(f"[BOT] menu_call pressed from={call.from_user.id}")
-    sessions = await api.list_sessions()
+    log.info("menu_call pressed", user=call.from_user.id)
+    sessions = await api.authorized_sessions()
     await state.clear()
     await call.message.edit_text("Выберите сессию для звонка:", reply_markup=call_sessions_keyboard(sessions))
 
 @dp.callback_query(F.data.startswith("call:from:"))
 async def call_from_selected(call: types.CallbackQuery, state: FSMContext):
     number = call.data.split(":", 2)[-1]
-    print(f"[BOT] call_from_selected from={call.from_user.id} number={number}")
+    log.info("call_from_selected", user=call.from_user.id, number=number)
     await state.set_state(CallStates.waiting_username)
     await state.update_data(call_from=number)
     await call.message.edit_text(f"Введите @username или ссылку на пользователя для звонка от {number}:")
 
+def call_rejected_text(number: str, res: Dict[str, Any]) -> str | None:
+    st = res.get("status")
+    if st == "not_authorized":
+        return f"Сессия {number} не авторизована."
+    if st == "already_in_call":
+        return f"Уже идёт звонок от {number} к {res.get('to')}."
+    if st == "account_busy":
+        return f"С аккаунта {number} уже идёт звонок. Повторите через {res.get('retry_after', 1)} сек."
+    if st == "overloaded":
+        return f"Сервер перегружен. Повторите через {res.get('retry_after', 1)} сек."
+    if st == "flood_wait":
+        return f"Telegram ограничил запросы для {number}. Повторите через {res.get('retry_after', 1)} сек."
+    return None
+
+_watchers: set[asyncio.Task] = set()
+
+def watch_scheduled_call(chat_id: int, job: Dict[str, Any], username: str):
+    task = asyncio.create_task(report_scheduled_call(chat_id, job, username))
+    _watchers.add(task)
+    task.add_done_callback(_watchers.discard)
+
+async def report_scheduled_call(chat_id: int, job: Dict[str, Any], username: str):
+    number = job["number"]
+    await asyncio.sleep(max(0.0, job["at"] - time.time()))
+    deadline = time.monotonic() + CALL_RESULT_TIMEOUT
+    try:
+        while True:
+            done = await api.scheduled_job(job["id"], number)
+            if done is not None and done.get("status") != "pending":
+                break
+            if time.monotonic() >= deadline:
+                log.warning("scheduled call result unknown", id=job["id"])
+                return
+            await asyncio.sleep(CALL_RESULT_POLL)
+        st = done["status"]
+        log.info("scheduled call done", id=job["id"], status=st)
+        if st == "cancelled":
+            return
+        if st == "fired":
+            await bot.send_sticker(chat_id, "CAACAgIAAxkBAAEN1fNntLPXRVc5iyd-PqrIrNZYy7PDswACQQEAAs0bMAjx8GIY3_aWWDYE")
+            await bot.send_message(chat_id, f"Звонок запущен от {number} к {username}.", reply_markup=start_keyboard())
+            return
+        if st == "missed":
+            text = f"Звонок от {number} к {username} пропущен: сервер был недоступен."
+        else:
+            res = done.get("result") or {}
+            reason = call_rejected_text(number, res) or f"Ошибка: {res.get('detail', res.get('status', 'unknown'))}"
+            text = f"Звонок от {number} к {username} не состоялся. {reason}"
+        await bot.send_message(chat_id, text, reply_markup=start_keyboard())
+    except Exception as e:
+        log.warning("scheduled call report failed", id=job["id"], err=e)
+
 @dp.message(CallStates.waiting_username)
 async def call_enter_username(message: types.Message, state: FSMContext):
     data = await state.get_data()
     number = data.get("call_from")
     username = message.text.strip()
-    await message.reply("Позвоним через 30 секунд....")
-    await asyncio.sleep(30)
-    await message.reply_sticker("CAACAgIAAxkBAAEN1fNntLPXRVc5iyd-PqrIrNZYy7PDswACQQEAAs0bMAjx8GIY3_aWWDYE")
-    print(f"[BOT] call_enter_username from={message.from_user.id} number={number} to={username}")
-    res = await api_call_start(number, username)
-    http = res.get("http")
-    status_val = res.get("status")
-    if http in (200, 202) and status_val == "call_started":
-        await state.clear()
-        await message.answer(f"Звонок запущен от {number} к {username}.", reply_markup=start_keyboard())
+    log.info("call_enter_username", user=message.from_user.id, number=number, to=username)
+    res = await api.schedule_call(number, username, delay=CALL_DELAY)
+    await state.clear()
+    rejected = call_rejected_text(number, res)
+    if rejected is not None:
+        await message.answer(rejected, reply_markup=start_keyboard())
         return
-    if status_val == "already_in_call":
-        await message.answer(f"Уже идёт звонок от {number} к {res.get('to')}.")
+    if res.get("status") != "scheduled":
+        await message.answer(f"Ошибка планирования звонка: {res}", reply_markup=start_keyboard())
         return
-    if status_val == "not_authorized":
-        await state.clear()
-        await message.answer(f"Сессия {number} не авторизована.", reply_markup=start_keyboard())
+    job_id = res["job"]["id"]
+    kb = InlineKeyboardBuilder()
+    kb.button(text="Отменить звонок", callback_data=f"call:cancel:{job_id}")
+    kb.button(text="↩️ Назад", callback_data="back:home")
+    kb.adjust(1)
+    await message.reply(f"Позвоним от {number} к {username} через {CALL_DELAY} секунд....", reply_markup=kb.as_markup())
+    watch_scheduled_call(message.chat.id, res["job"], username)
+
+@dp.callback_query(F.data.startswith("call:cancel:"))
+async def call_cancel(call: types.CallbackQuery, state: FSMContext):
+    job_id = call.data.split(":", 2)[-1]
+    log.info("call_cancel", user=call.from_user.id, id=job_id)
+    res = await api.cancel_call(job_id)
+    if res.get("status") == "cancelled":
+        await call.message.edit_text("Звонок отменён.", reply_markup=start_keyboard())
         return
-    await state.clear()
-    await message.answer(f"Ошибка запуска звонка: {res}", reply_markup=start_keyboard())
-    
+    if res.get("status") == "not_found":
+        await call.message.edit_text("Звонок уже состоялся или был отменён.", reply_markup=start_keyboard())
+        return
+    await call.answer("Не удалось отменить звонок")
+
+_metrics_runner = None
+
+@dp.startup()
+async def on_startup():
+    global _metrics_runner
+    if BOT_METRICS_PORT:
+        _metrics_runner = await start_metrics_server("0.0.0.0", BOT_METRICS_PORT)
+    if BOT_MODE == "webhook" and BOT_WEBHOOK_REGISTER:
+        await bot.set_webhook(BOT_WEBHOOK_URL + BOT_WEBHOOK_PATH, secret_token=BOT_WEBHOOK_SECRET or None)
+        log.info("webhook registered", url=BOT_WEBHOOK_URL + BOT_WEBHOOK_PATH)
+
+@dp.shutdown()
+async def on_dp_shutdown():
+    for task in list(_watchers):
+        task.cancel()
+    if _metrics_runner is not None:
+        await _metrics_runner.cleanup()
 
 async def on_shutdown():
     await api.close()
 
+def run_webhook():
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=BOT_WEBHOOK_SECRET or None).register(app, path=BOT_WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    add_metrics_route(app)
+    web.run_app(app, host=BOT_WEBHOOK_HOST, port=BOT_WEBHOOK_PORT, reuse_port=True, print=None)
+
 if __name__ == '__main__':
     try:
-        dp.run_polling(bot)
+        if BOT_MODE == "webhook":
+            run_webhook()
+        else:
+            dp.run_polling(bot)
     finally:
         asyncio.run(on_shutdown())
@@ -1,97 +1,200 @@
 import asyncio
-import json
-import logging
-from typing import Any, Dict, List, Optional
+import time
+import random
+from typing import Any, AsyncIterator, Dict, List, Optional
 import aiohttp
 
-logging.basicConfig(level=logging.INFO)
+from applog import get_logger
+from fastjson import loads
+from metrics import REGISTRY
+
+log = get_logger("bot_api_client")
+
+API_REQUEST_SECONDS = REGISTRY.histogram("callmejoe_bot_api_request_seconds", "Latency of bot -> API requests.", ["endpoint", "status"])
+API_RETRIES = REGISTRY.counter("callmejoe_bot_api_retries_total", "Retried bot -> API GET requests.", ["endpoint"])
+
+ENDPOINT_TIMEOUTS = {
+    "list_sessions": 15.0,
+    "session_info": 10.0,
+    "session_info_batch": 30.0,
+    "init_new": 30.0,
+    "enter_code": 30.0,
+    "enter_2fa": 30.0,
+    "schedule_call": 10.0,
+    "cancel_call": 10.0,
+    "scheduled_calls": 10.0,
+    "scheduled_job": 5.0,
+}
+
+RETRY_STATUSES = (502, 503, 504)
 
 class CallMeJoeAPI:
-    def __init__(self, base_url: str, timeout: int = 20):
-        self.base_url = base_url.rstrip("/")
+    def __init__(self, base_url: str, timeout: int = 20, sessions_ttl: float = 5.0, uds: Optional[str] = None, limit: int = 64, keepalive_timeout: float = 60.0, retries: int = 2, retry_backoff: float = 0.2, timeouts: Optional[Dict[str, float]] = None):
+        self.base_url = (base_url or "http://localhost").rstrip("/")
         self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.uds = uds
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._timeouts = {name: aiohttp.ClientTimeout(total=t) for name, t in {**ENDPOINT_TIMEOUTS, **(timeouts or {})}.items()}
         self._session: Optional[aiohttp.ClientSession] = None
+        self.sessions_ttl = sessions_ttl
+        self._sessions_cache: Optional[List[Dict[str, Any]]] = None
+        self._sessions_cached_at = 0.0
+        self._sessions_inflight: Optional[asyncio.Future] = None
+
+    def _connector(self) -> aiohttp.BaseConnector:
+        if self.uds:
+            return aiohttp.UnixConnector(path=self.uds, limit=self.limit, keepalive_timeout=self.keepalive_timeout)
+        return aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit, keepalive_timeout=self.keepalive_timeout, ttl_dns_cache=300)
 
     async def _get_sess(self) -> aiohttp.ClientSession:
         if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession(timeout=self.timeout)
+            self._session = aiohttp.ClientSession(connector=self._connector(), timeout=self.timeout)
         return self._session
 
     async def close(self):
         if self._session and not self._session.closed:
             await self._session.close()
 
-    async def list_sessions(self) -> List[Dict[str, Any]]:
-        url = f"{self.base_url}/sessions/list"
+    async def _request(self, endpoint: str, method: str, path: str, ok: tuple = (200,), params: Optional[Dict[str, Any]] = None, payload: Optional[Dict[str, Any]] = None) -> Optional[Any]:
+        url = f"{self.base_url}{path}"
         sess = await self._get_sess()
+        timeout = self._timeouts.get(endpoint, self.timeout)
+        attempts = 1 + (self.retries if method == "GET" else 0)
+        t0 = time.perf_counter()
+        status: Any = "error"
         try:
-            print(f"[API] GET {url}")
-            async with sess.get(url) as r:
-                txt = await r.text()
-                print(f"[API] {r.status} {txt}")
-                if r.status == 200:
-                    data = json.loads(txt)
-                    return data.get("sessions", [])
+            for attempt in range(attempts):
+                if attempt:
+                    API_RETRIES.inc(endpoint=endpoint)
+                    await asyncio.sleep(random.uniform(0, self.retry_backoff * 2 ** attempt))
+                try:
+                    log.debug("request", method=method, url=url, attempt=attempt)
+                    async with sess.request(method, url, params=params, json=payload, timeout=timeout) as r:
+                        status = r.status
+                        if r.status in RETRY_STATUSES and attempt + 1 < attempts:
+                            continue
+                        body = await r.read()
+                        log.debug("response", url=url, status=r.status, size=len(body))
+                        if r.status in ok:
+                            return loads(body)
+                        return None
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    status = "error"
+                    if attempt + 1 >= attempts:
+                        raise
+                    log.debug("retrying", endpoint=endpoint, err=e)
         except Exception as e:
-            print(f"[API] list_sessions error {e}")
-        return []
+            log.warning(f"{endpoint} error", err=e)
+        finally:
+            API_REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint=endpoint, status=status)
+        return None
 
-    async def session_info(self, number: str) -> Dict[str, Any]:
-        url = f"{self.base_url}/sessions/info"
-        params = {"number": number}
+    def invalidate_sessions(self):
+        self._sessions_cache = None
+        self._sessions_inflight = None
+
+    def _clear_sessions_inflight(self, fut: asyncio.Future):
+        if self._sessions_inflight is fut:
+            self._sessions_inflight = None
+
+    async def list_sessions(self, force: bool = False) -> List[Dict[str, Any]]:
+        if not force and self._sessions_cache is not None and time.monotonic() - self._sessions_cached_at < self.sessions_ttl:
+            return list(self._sessions_cache)
+        fut = self._sessions_inflight
+        if fut is None or force:
+            fut = asyncio.ensure_future(self._fetch_sessions())
+            self._sessions_inflight = fut
+            fut.add_done_callback(self._clear_sessions_inflight)
+        items = await asyncio.shield(fut)
+        return list(items) if items is not None else []
+
+    async def _fetch_sessions(self) -> Optional[List[Dict[str, Any]]]:
+        data = await self._request("list_sessions", "GET", "/sessions/list")
+        if data is None:
+            return None
+        items = data.get("sessions", [])
+        if self._sessions_inflight is asyncio.current_task():
+            self._sessions_cache = items
+            self._sessions_cached_at = time.monotonic()
+        return items
+
+    async def authorized_sessions(self) -> List[Dict[str, Any]]:
+        data = await self._request("list_sessions", "GET", "/sessions/list", params={"authorized": "true"})
+        return data.get("sessions", []) if data is not None else []
+
+    async def iter_sessions(self, refresh: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        url = f"{self.base_url}/sessions/list/stream"
+        params = {"refresh": "true" if refresh else "false"}
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.timeout.total)
         sess = await self._get_sess()
-        try:
-            print(f"[API] GET {url} {params}")
-            async with sess.get(url, params=params) as r:
-                txt = await r.text()
-                print(f"[API] {r.status} {txt}")
-                if r.status == 200:
-                    return json.loads(txt)
-        except Exception as e:
-            print(f"[API] session_info error {e}")
-        return {"status": "error"}
+        t0 = time.perf_counter()
+        log.debug("request", method="GET", url=url)
+        async with sess.get(url, params=params, timeout=timeout) as r:
+            log.debug("response", url=url, status=r.status, stream=True)
+            API_REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint="iter_sessions_first_byte", status=r.status)
+            if r.status != 200:
+                return
+            async for line in r.content:
+                line = line.strip()
+                if not line:
+                    continue
+                item = loads(line)
+                if item.get("status") == "error":
+                    log.warning("iter_sessions error", err=item.get("detail"))
+                    return
+                yield item
+
+    async def session_info(self, number: str) -> Dict[str, Any]:
+        data = await self._request("session_info", "GET", "/sessions/info", params={"number": number})
+        return data if data is not None else {"status": "error"}
+
+    async def session_info_batch(self, numbers: List[str], refresh: bool = False) -> List[Dict[str, Any]]:
+        data = await self._request("session_info_batch", "POST", "/sessions/info:batch", payload={"numbers": list(numbers), "refresh": refresh})
+        return data.get("sessions", []) if data is not None else []
 
     async def init_new(self, number: str) -> Dict[str, Any]:
-        url = f"{self.base_url}/sessions/initNew"
-        payload = {"number": number}
-        sess = await self._get_sess()
-        try:
-            print(f"[API] POST {url} {payload}")
-            async with sess.post(url, json=payload) as r:
-                txt = await r.text()
-                print(f"[API] {r.status} {txt}")
-                if r.status in (200, 202):
-                    return json.loads(txt)
-        except Exception as e:
-            print(f"[API] init_new error {e}")
-        return {"status": "error"}
+        data = await self._request("init_new", "POST", "/sessions/initNew", ok=(200, 202, 429), payload={"number": number})
+        if data is None:
+            return {"status": "error"}
+        self.invalidate_sessions()
+        return data
 
     async def enter_code(self, number: str, code: str) -> Dict[str, Any]:
-        url = f"{self.base_url}/sessions/enterCode"
-        payload = {"number": number, "code": code}
-        sess = await self._get_sess()
-        try:
-            print(f"[API] POST {url} {payload}")
-            async with sess.post(url, json=payload) as r:
-                txt = await r.text()
-                print(f"[API] {r.status} {txt}")
-                if r.status in (200, 202):
-                    return json.loads(txt)
-        except Exception as e:
-            print(f"[API] enter_code error {e}")
-        return {"status": "error"}
+        data = await self._request("enter_code", "POST", "/sessions/enterCode", ok=(200, 202, 429), payload={"number": number, "code": code})
+        if data is None:
+            return {"status": "error"}
+        if data.get("status") in ("authorized", "already_authorized"):
+            self.invalidate_sessions()
+        return data
 
     async def enter_2fa(self, number: str, password: str) -> Dict[str, Any]:
-        url = f"{self.base_url}/sessions/enter2FA"
-        payload = {"number": number, "password": password}
-        sess = await self._get_sess()
-        try:
-            print(f"[API] POST {url} {payload}")
-            async with sess.post(url, json=payload) as r:
-                txt = await r.text()
-                print(f"[API] {r.status} {txt}")
-                if r.status in (200, 202):
-                    return json.loads(txt)
-        except Exception as e:
-            print(f"[API] enter_2fa error {e}")
-        return {"status": "error"}
+        data = await self._request("enter_2fa", "POST", "/sessions/enter2FA", ok=(200, 202, 429), payload={"number": number, "password": password})
+        if data is None:
+            return {"status": "error"}
+        if data.get("status") in ("authorized", "already_authorized"):
+            self.invalidate_sessions()
+        return data
+
+    async def schedule_call(self, number: str, username: str, delay: float | None = None, at: float | None = None) -> Dict[str, Any]:
+        payload = {"number": number, "username": username}
+        if at is not None:
+            payload["at"] = at
+        else:
+            payload["delay"] = delay or 0
+        data = await self._request("schedule_call", "POST", "/call/schedule", ok=(200, 202, 400, 429, 503), payload=payload)
+        return data if data is not None else {"status": "error"}
+
+    async def cancel_call(self, job_id: str) -> Dict[str, Any]:
+        data = await self._request("cancel_call", "POST", "/call/cancel", ok=(200, 404), payload={"id": job_id})
+        return data if data is not None else {"status": "error"}
+
+    async def scheduled_calls(self) -> List[Dict[str, Any]]:
+        data = await self._request("scheduled_calls", "GET", "/call/scheduled")
+        return data.get("jobs", []) if data is not None else []
+
+    async def scheduled_job(self, job_id: str, number: str) -> Optional[Dict[str, Any]]:
+        data = await self._request("scheduled_job", "GET", f"/call/scheduled/{job_id}", ok=(200, 404), params={"number": number})
+        return data.get("job") if data is not None else None
@@ -0,0 +1,79 @@
+import asyncio
+from collections import OrderedDict
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from applog import get_logger
+from metrics import REGISTRY
+
+log = get_logger("bot_edits")
+
+EDITS = REGISTRY.counter("callmejoe_bot_message_edits_total", "Bot message edits by result.", ["result"])
+
+class EditDebouncer:
+    def __init__(self, delay: float = 0.3, remember: int = 1024):
+        self.delay = delay
+        self.remember = remember
+        self._pending: dict[tuple[int, int], dict] = {}
+        self._last: "OrderedDict[tuple[int, int], tuple]" = OrderedDict()
+
+    @staticmethod
+    def _key(message: types.Message) -> tuple[int, int]:
+        return message.chat.id, message.message_id
+
+    def schedule(self, message: types.Message, text: str, reply_markup=None):
+        key = self._key(message)
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = {"message": message}
+            entry["task"] = asyncio.create_task(self._flush_later(key))
+            self._pending[key] = entry
+        else:
+            EDITS.inc(result="coalesced")
+        entry["text"] = text
+        entry["reply_markup"] = reply_markup
+
+    def cancel(self, message: types.Message):
+        entry = self._pending.pop(self._key(message), None)
+        if entry is not None:
+            entry["task"].cancel()
+
+    async def edit_now(self, message: types.Message, text: str, reply_markup=None):
+        self.cancel(message)
+        await self._edit(self._key(message), message, text, reply_markup)
+
+    async def _flush_later(self, key: tuple[int, int]):
+        await asyncio.sleep(self.delay)
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return
+        try:
+            await self._edit(key, entry["message"], entry["text"], entry["reply_markup"])
+        except Exception as e:
+            log.warning("debounced edit failed", chat=key[0], err=e)
+
+    async def _edit(self, key: tuple[int, int], message: types.Message, text: str, reply_markup):
+        last = self._last.get(key)
+        if last is not None and last[0] == text and last[1] is reply_markup:
+            EDITS.inc(result="skipped")
+            return
+        for attempt in range(2):
+            try:
+                await message.edit_text(text, reply_markup=reply_markup)
+                EDITS.inc(result="sent")
+                break
+            except TelegramRetryAfter as e:
+                EDITS.inc(result="rate_limited")
+                if attempt:
+                    raise
+                log.warning("edit rate limited", chat=key[0], retry_after=e.retry_after)
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest as e:
+                if "message is not modified" not in str(e):
+                    raise
+                EDITS.inc(result="not_modified")
+                break
+        self._last[key] = (text, reply_markup)
+        self._last.move_to_end(key)
+        while len(self._last) > self.remember:
+            self._last.popitem(last=False)
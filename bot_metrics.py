@@ -0,0 +1,47 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from applog import get_logger
+from metrics import CONTENT_TYPE, REGISTRY
+
+log = get_logger("bot_metrics")
+
+HANDLER_SECONDS = REGISTRY.histogram("callmejoe_bot_handler_seconds", "Latency of bot update handlers.", ["handler", "outcome"])
+UPDATE_SECONDS = REGISTRY.histogram("callmejoe_bot_update_seconds", "Time to process one update, including middlewares and FSM.", ["mode", "type", "outcome"])
+UPDATE_LAG_SECONDS = REGISTRY.histogram("callmejoe_bot_update_lag_seconds", "Delay between a message being sent and the bot starting to process it.", ["mode"], buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0))
+
+class UpdateTimingMiddleware(BaseMiddleware):
+    def __init__(self, mode: str):
+        self.mode = mode
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]) -> Any:
+        message = getattr(event, "message", None)
+        if message is not None and getattr(message, "date", None) is not None:
+            UPDATE_LAG_SECONDS.observe(max(0.0, time.time() - message.date.timestamp()), mode=self.mode)
+        with UPDATE_SECONDS.time(mode=self.mode, type=getattr(event, "event_type", "unknown")):
+            return await handler(event, data)
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_obj = data.get("handler")
+        name = getattr(getattr(handler_obj, "callback", None), "__name__", "unknown")
+        with HANDLER_SECONDS.time(handler=name):
+            return await handler(event, data)
+
+async def _metrics_view(request: web.Request) -> web.Response:
+    return web.Response(body=REGISTRY.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+def add_metrics_route(app: web.Application):
+    app.router.add_get("/metrics", _metrics_view)
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    add_metrics_route(app)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info("metrics server started", host=host, port=port)
+    return runner
@@ -0,0 +1,95 @@
+import os
+import json
+import asyncio
+import sqlite3
+import zlib
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Dict, Mapping, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from applog import get_logger
+
+log = get_logger("bot_storage")
+
+def _key(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.business_connection_id or ''}:{key.destiny}"
+
+class SQLiteStorage(BaseStorage):
+    SCHEMA = "CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL DEFAULT '{}')"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(self.SCHEMA)
+        log.info("opened", path=path)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        self._db.execute(
+            "INSERT INTO fsm (key, state) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET state = excluded.state",
+            (_key(key), value)
+        )
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = self._db.execute("SELECT state FROM fsm WHERE key = ?", (_key(key),)).fetchone()
+        return None if row is None else row[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        self._db.execute(
+            "INSERT INTO fsm (key, data) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (_key(key), json.dumps(dict(data), ensure_ascii=False))
+        )
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = self._db.execute("SELECT data FROM fsm WHERE key = ?", (_key(key),)).fetchone()
+        return {} if row is None else json.loads(row[0])
+
+    async def close(self) -> None:
+        self._db.close()
+
+class FileLockEventIsolation(BaseEventIsolation):
+    def __init__(self, lock_dir: str, buckets: int = 256):
+        self.lock_dir = lock_dir
+        self.buckets = buckets
+        self._local: dict[int, asyncio.Lock] = {}
+        os.makedirs(lock_dir, exist_ok=True)
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        bucket = zlib.crc32(_key(key).encode("utf-8")) % self.buckets
+        local = self._local.setdefault(bucket, asyncio.Lock())
+        async with local:
+            if fcntl is None:
+                yield
+                return
+            fd = os.open(os.path.join(self.lock_dir, f"{bucket:03d}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)
+
+    async def close(self) -> None:
+        self._local.clear()
+
+def make_storage(kind: str, path: str) -> BaseStorage:
+    if kind == "sqlite":
+        return SQLiteStorage(path)
+    if kind == "memory":
+        return MemoryStorage()
+    raise ValueError(f"unknown FSM storage: {kind}")
+
+def make_isolation(kind: str, lock_dir: str) -> BaseEventIsolation:
+    if kind == "file":
+        return FileLockEventIsolation(lock_dir)
+    if kind == "memory":
+        return SimpleEventIsolation()
+    raise ValueError(f"unknown event isolation: {kind}")
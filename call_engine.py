@@ -0,0 +1,227 @@
+import asyncio
+import time
+from collections import deque
+from typing import Callable
+from weakref import WeakKeyDictionary
+from telethon import TelegramClient
+from telethon.utils import get_peer_id
+
+from applog import get_logger
+from account_manager import AccountManager
+from metrics import stage
+from peer_cache import PeerCache
+
+log = get_logger("call_engine")
+
+PyTgCalls = None
+CallConfig = None
+
+def load_pytgcalls():
+    global PyTgCalls, CallConfig
+    if PyTgCalls is None or CallConfig is None:
+        t0 = time.perf_counter()
+        with stage("import_pytgcalls"):
+            import pytgcalls
+            import pytgcalls.types
+        PyTgCalls = PyTgCalls or pytgcalls.PyTgCalls
+        CallConfig = CallConfig or pytgcalls.types.CallConfig
+        log.info("pytgcalls loaded", ms=(time.perf_counter() - t0) * 1000)
+    return PyTgCalls, CallConfig
+
+_STARTED: "WeakKeyDictionary[TelegramClient, PyTgCalls]" = WeakKeyDictionary()
+
+async def ensure_started(client: TelegramClient) -> "PyTgCalls":
+    call_py = _STARTED.get(client)
+    if call_py is None:
+        py_tg_calls, _ = load_pytgcalls()
+        call_py = py_tg_calls(client)
+        with stage("pytgcalls_start"):
+            await call_py.start()
+        _STARTED[client] = call_py
+    return call_py
+
+class CallEngine:
+    def __init__(self, manager: AccountManager, peers: PeerCache, prewarm_top: int = 0, ring_window: int = 512, warmup: bool = True, idle_timeout: float = 600.0, sweep_interval: float = 60.0, owns: Callable[[str], bool] | None = None):
+        self._manager = manager
+        self._peers = peers
+        self.prewarm_top = prewarm_top
+        self.warmup = warmup
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._owns = owns or (lambda number: True)
+        self._engines: dict[str, dict] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._ring_ms: deque = deque(maxlen=ring_window)
+        self._ring_count = 0
+        self._ring_total_ms = 0.0
+        self._prewarm_task: asyncio.Task | None = None
+        self._sweeper: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._engines)
+
+    def client_for(self, number: str) -> TelegramClient | None:
+        eng = self._engines.get(number)
+        return None if eng is None else eng["client"]
+
+    def pytgcalls_for(self, number: str) -> "PyTgCalls | None":
+        eng = self._engines.get(number)
+        return None if eng is None else eng["pytgcalls"]
+
+    async def acquire(self, number: str) -> "PyTgCalls | None":
+        lock = self._locks.setdefault(number, asyncio.Lock())
+        async with lock:
+            eng = self._engines.get(number)
+            if eng is not None:
+                if eng["client"].is_connected():
+                    eng["last_used"] = time.monotonic()
+                    return eng["pytgcalls"]
+                log.info("stale engine", number=number)
+                self._drop(number)
+            client = await self._manager.get_client(number)
+            if client is None:
+                return None
+            try:
+                t0 = time.perf_counter()
+                call_py = await ensure_started(client)
+                log.info("started", number=number, ms=(time.perf_counter() - t0) * 1000)
+            except BaseException:
+                self._manager.release_client(number, client)
+                raise
+            self._engines[number] = {"client": client, "pytgcalls": call_py, "last_used": time.monotonic()}
+            return call_py
+
+    async def play(self, number: str, target: str) -> float | None:
+        call_py = await self.acquire(number)
+        if call_py is None:
+            return None
+        peer = await self._peers.resolve(number, self.client_for(number), target)
+        t0 = time.perf_counter()
+        with stage("play"):
+            await call_py.play(chat_id=get_peer_id(peer), stream=None, config=load_pytgcalls()[1]())
+        ring_ms = (time.perf_counter() - t0) * 1000
+        self._ring_ms.append(ring_ms)
+        self._ring_count += 1
+        self._ring_total_ms += ring_ms
+        self._record_use(number)
+        log.info("ringing", number=number, ring_ms=ring_ms)
+        return ring_ms
+
+    async def prepare(self, number: str, target: str) -> bool:
+        if await self.acquire(number) is None:
+            return False
+        await self._peers.resolve(number, self.client_for(number), target)
+        return True
+
+    def _record_use(self, number: str):
+        try:
+            meta = self._manager.read_meta(number, "CALLS") or {}
+            count = int(meta.get("count") or 0) + 1
+            self._manager.write_meta(number, "CALLS", {"count": count, "last_call_at": f"{time.time():.3f}"})
+        except Exception as e:
+            log.warning("usage write error", number=number, err=e)
+
+    def most_used(self, limit: int) -> list[str]:
+        counts = []
+        for number, _ in self._manager.list_accounts():
+            if not self._owns(number):
+                continue
+            meta = self._manager.read_meta(number, "CALLS") or {}
+            count = int(meta.get("count") or 0)
+            if count > 0:
+                counts.append((count, number))
+        counts.sort(reverse=True)
+        return [number for _, number in counts[:limit]]
+
+    async def prewarm(self, numbers: list[str]):
+        for number in numbers:
+            if not self._owns(number):
+                continue
+            try:
+                if await self.acquire(number) is not None:
+                    log.info("prewarmed", number=number)
+            except Exception as e:
+                log.warning("prewarm error", number=number, err=e)
+
+    async def _background_start(self):
+        if self.warmup:
+            try:
+                await asyncio.to_thread(load_pytgcalls)
+            except Exception as e:
+                log.warning("warmup failed", err=e)
+        if self.prewarm_top > 0:
+            await self.prewarm(self.most_used(self.prewarm_top))
+
+    async def sweep_idle(self) -> int:
+        now = time.monotonic()
+        dropped = 0
+        for number, eng in list(self._engines.items()):
+            if now - eng["last_used"] < self.idle_timeout:
+                continue
+            call = self._manager.registry.get_call(number)
+            if call is not None and time.time() - call["started_at"] < self.idle_timeout:
+                continue
+            lock = self._locks.get(number)
+            if lock is not None and lock.locked():
+                continue
+            if call is not None:
+                self._manager.registry.release_call(number)
+            self._drop(number)
+            self._locks.pop(number, None)
+            dropped += 1
+        if dropped:
+            log.info("idle engines dropped", count=dropped, left=len(self._engines))
+        return dropped
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep_idle()
+            except Exception as e:
+                log.exception("engine sweep error", err=e)
+
+    def start(self):
+        if self.idle_timeout > 0 and (self._sweeper is None or self._sweeper.done()):
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+        if (self.warmup or self.prewarm_top > 0) and (self._prewarm_task is None or self._prewarm_task.done()):
+            self._prewarm_task = asyncio.create_task(self._background_start())
+
+    def _drop(self, number: str):
+        eng = self._engines.pop(number, None)
+        if eng is not None:
+            self._manager.release_client(number, eng["client"])
+
+    async def close(self):
+        if self._prewarm_task is not None and not self._prewarm_task.done():
+            self._prewarm_task.cancel()
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        for number in list(self._engines):
+            self._drop(number)
+
+    def stats(self) -> dict:
+        samples = sorted(self._ring_ms)
+
+        def pct(p: float) -> float | None:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))], 1)
+
+        return {
+            "pytgcalls_loaded": PyTgCalls is not None,
+            "warm_engines": len(self._engines),
+            "peer_cache": {"hits": self._peers.hits, "misses": self._peers.misses},
+            "calls": self._ring_count,
+            "time_to_ring_ms": {
+                "last": round(self._ring_ms[-1], 1) if self._ring_ms else None,
+                "avg": round(self._ring_total_ms / self._ring_count, 1) if self._ring_count else None,
+                "p50": pct(0.50),
+                "p99": pct(0.99),
+            },
+        }
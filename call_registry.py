@@ -0,0 +1,116 @@
+import json
+import time
+import sqlite3
+
+from applog import get_logger
+
+log = get_logger("call_registry")
+
+class MemoryRegistry:
+    def __init__(self):
+        self._calls: dict[str, dict] = {}
+        self._auth: dict[str, dict] = {}
+
+    def claim_call(self, number: str, node: str, data: dict) -> dict | None:
+        existing = self._calls.get(number)
+        if existing is not None:
+            return existing
+        self._calls[number] = {**data, "node": node, "started_at": time.time()}
+        return None
+
+    def get_call(self, number: str) -> dict | None:
+        return self._calls.get(number)
+
+    def release_call(self, number: str):
+        self._calls.pop(number, None)
+
+    def release_node(self, node: str) -> int:
+        numbers = [n for n, c in self._calls.items() if c["node"] == node]
+        for number in numbers:
+            del self._calls[number]
+        return len(numbers)
+
+    def count_calls(self) -> int:
+        return len(self._calls)
+
+    def put_auth(self, phone: str, data: dict):
+        self._auth[phone] = {**data, "updated_at": time.time()}
+
+    def get_auth(self, phone: str) -> dict | None:
+        return self._auth.get(phone)
+
+    def pop_auth(self, phone: str) -> dict | None:
+        return self._auth.pop(phone, None)
+
+    def count_auth(self) -> int:
+        return len(self._auth)
+
+    def close(self):
+        pass
+
+class SQLiteRegistry:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS active_calls (number TEXT PRIMARY KEY, node TEXT NOT NULL, data TEXT NOT NULL, started_at REAL NOT NULL);
+    CREATE TABLE IF NOT EXISTS pending_auth (phone TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(self.SCHEMA)
+        log.info("opened", path=path)
+
+    def claim_call(self, number: str, node: str, data: dict) -> dict | None:
+        now = time.time()
+        cur = self._db.execute(
+            "INSERT OR IGNORE INTO active_calls (number, node, data, started_at) VALUES (?, ?, ?, ?)",
+            (number, node, json.dumps(data, ensure_ascii=False), now)
+        )
+        if cur.rowcount == 1:
+            return None
+        return self.get_call(number) or {"node": None}
+
+    def get_call(self, number: str) -> dict | None:
+        row = self._db.execute("SELECT node, data, started_at FROM active_calls WHERE number = ?", (number,)).fetchone()
+        if row is None:
+            return None
+        return {**json.loads(row[1]), "node": row[0], "started_at": row[2]}
+
+    def release_call(self, number: str):
+        self._db.execute("DELETE FROM active_calls WHERE number = ?", (number,))
+
+    def release_node(self, node: str) -> int:
+        return self._db.execute("DELETE FROM active_calls WHERE node = ?", (node,)).rowcount
+
+    def count_calls(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM active_calls").fetchone()[0]
+
+    def put_auth(self, phone: str, data: dict):
+        self._db.execute(
+            "INSERT OR REPLACE INTO pending_auth (phone, data, updated_at) VALUES (?, ?, ?)",
+            (phone, json.dumps(data, ensure_ascii=False), time.time())
+        )
+
+    def get_auth(self, phone: str) -> dict | None:
+        row = self._db.execute("SELECT data, updated_at FROM pending_auth WHERE phone = ?", (phone,)).fetchone()
+        return None if row is None else {**json.loads(row[0]), "updated_at": row[1]}
+
+    def pop_auth(self, phone: str) -> dict | None:
+        data = self.get_auth(phone)
+        if data is not None:
+            self._db.execute("DELETE FROM pending_auth WHERE phone = ?", (phone,))
+        return data
+
+    def count_auth(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM pending_auth").fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+def open_registry(kind: str, path: str):
+    if kind == "sqlite":
+        return SQLiteRegistry(path)
+    if kind == "memory":
+        return MemoryRegistry()
+    raise ValueError(f"unknown call registry: {kind}")
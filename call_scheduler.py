@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import uuid
+import heapq
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable
+
+from applog import get_logger
+
+log = get_logger("call_scheduler")
+
+class CallScheduler:
+    def __init__(self, path: str, fire: Callable[[dict], Awaitable[dict]], prewarm: Callable[[dict], Awaitable[None]] | None = None, prewarm_lead: float = 10.0, max_lateness: float = 300.0, history_size: int = 100, retry_delay: float = 5.0):
+        self.path = path
+        self._fire_cb = fire
+        self._prewarm_cb = prewarm
+        self.prewarm_lead = prewarm_lead
+        self.max_lateness = max_lateness
+        self.retry_delay = retry_delay
+        self._heap: list[tuple[float, str]] = []
+        self._jobs: dict[str, dict] = {}
+        self._history: deque = deque(maxlen=history_size)
+        self._wakeup = asyncio.Event()
+        self._runner: asyncio.Task | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                jobs = json.load(f)
+        except Exception as e:
+            log.warning("load error", path=self.path, err=e)
+            return
+        for job in jobs:
+            job["prewarmed"] = False
+            self._jobs[job["id"]] = job
+            heapq.heappush(self._heap, (job["at"], job["id"]))
+        log.info("loaded", jobs=len(self._jobs))
+
+    def _persist(self, jobs: list[dict]):
+        tmp_path = self.path + ".tmp"
+        pending = [self._public(job) for job in jobs]
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(pending, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def schedule(self, number: str, username: str, at: float) -> dict:
+        job = {"id": uuid.uuid4().hex[:12], "number": number, "username": username, "at": at, "created_at": time.time(), "status": "pending", "prewarmed": False}
+        self._persist([*self._jobs.values(), job])
+        self._jobs[job["id"]] = job
+        heapq.heappush(self._heap, (at, job["id"]))
+        self._wakeup.set()
+        log.info("scheduled", id=job["id"], number=number, in_s=at - time.time())
+        return self._public(job)
+
+    def cancel(self, job_id: str) -> dict | None:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        self._persist([j for j in self._jobs.values() if j is not job])
+        del self._jobs[job_id]
+        job["status"] = "cancelled"
+        self._history.append(self._public(job))
+        self._wakeup.set()
+        log.info("cancelled", id=job_id)
+        return self._public(job)
+
+    def get(self, job_id: str) -> dict | None:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return self._public(job)
+        return next((job for job in reversed(self._history) if job["id"] == job_id), None)
+
+    def list_jobs(self, include_history: bool = False) -> list[dict]:
+        jobs = sorted((self._public(job) for job in self._jobs.values()), key=lambda j: j["at"])
+        if include_history:
+            jobs = list(self._history) + jobs
+        return jobs
+
+    def _public(self, job: dict) -> dict:
+        return {k: v for k, v in job.items() if k != "prewarmed"}
+
+    def start(self):
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _run(self):
+        while True:
+            try:
+                await self._step()
+            except Exception as e:
+                log.exception("runner error", err=e)
+                await asyncio.sleep(self.retry_delay)
+
+    async def _step(self):
+        self._wakeup.clear()
+        while self._heap and self._heap[0][1] not in self._jobs:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            await self._wakeup.wait()
+            return
+        at, job_id = self._heap[0]
+        job = self._jobs[job_id]
+        now = time.time()
+        if now >= at:
+            try:
+                self._persist([j for j in self._jobs.values() if j is not job])
+            except Exception as e:
+                log.exception("persist error", id=job_id, err=e)
+            heapq.heappop(self._heap)
+            del self._jobs[job_id]
+            self._spawn(self._fire(job, now - at))
+            return
+        if not job["prewarmed"] and now >= at - self.prewarm_lead:
+            job["prewarmed"] = True
+            if self._prewarm_cb is not None:
+                self._spawn(self._prewarm(job))
+        next_wake = at if job["prewarmed"] else at - self.prewarm_lead
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, next_wake - now))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _prewarm(self, job: dict):
+        try:
+            await self._prewarm_cb(job)
+        except Exception as e:
+            log.warning("prewarm error", id=job["id"], err=e)
+
+    async def _fire(self, job: dict, lateness: float):
+        if lateness > self.max_lateness:
+            job["status"] = "missed"
+            log.info("missed", id=job["id"], late_s=lateness)
+        else:
+            try:
+                res = await self._fire_cb(job)
+                job["status"] = "fired" if res.get("status") == "call_started" else "failed"
+                job["result"] = res
+            except Exception as e:
+                job["status"] = "failed"
+                job["result"] = {"status": "error", "detail": str(e)}
+                log.exception("fire error", id=job["id"], err=e)
+            log.info("fired", id=job["id"], status=job["status"], late_ms=lateness * 1000)
+        job["fired_at"] = time.time()
+        self._history.append(self._public(job))
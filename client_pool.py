@@ -0,0 +1,204 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Callable
+from telethon import TelegramClient
+
+from applog import get_logger
+from metrics import stage
+
+log = get_logger("client_pool")
+
+async def timed_connect(client: TelegramClient):
+    with stage("connect"):
+        await client.connect()
+
+async def timed_is_authorized(client: TelegramClient) -> bool:
+    with stage("is_user_authorized"):
+        return await client.is_user_authorized()
+
+class ClientPool:
+    def __init__(self, factory: Callable[[str], TelegramClient | None], max_size: int = 64, idle_timeout: float = 300.0, health_interval: float = 60.0, sweep_interval: float = 30.0):
+        self._factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.sweep_interval = sweep_interval
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._locks: dict[str, list] = {}
+        self._sweeper: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    @asynccontextmanager
+    async def _key_lock(self, key: str):
+        slot = self._locks.get(key)
+        if slot is None:
+            slot = [asyncio.Lock(), 0]
+            self._locks[key] = slot
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                self._locks.pop(key, None)
+
+    async def acquire(self, key: str) -> TelegramClient | None:
+        async with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is not None:
+                if await self._ensure_healthy(key, entry):
+                    self._checkout(key, entry)
+                    return entry["client"]
+                self._entries.pop(key, None)
+                await self._close(key, entry["client"])
+                return None
+            client = self._factory(key)
+            if client is None:
+                return None
+            try:
+                await timed_connect(client)
+                if not await timed_is_authorized(client):
+                    await self._close(key, client)
+                    return None
+            except BaseException:
+                await self._close(key, client)
+                raise
+            entry = {"client": client, "borrowed": 0, "last_used": time.monotonic(), "last_checked": time.monotonic()}
+            self._entries[key] = entry
+            self._checkout(key, entry)
+            log.info("connected", key=key, size=len(self._entries))
+        await self._evict_overflow()
+        return client
+
+    def release(self, key: str, client: TelegramClient | None = None):
+        entry = self._entries.get(key)
+        if entry is None or (client is not None and entry["client"] is not client):
+            return
+        entry["borrowed"] = max(0, entry["borrowed"] - 1)
+        entry["last_used"] = time.monotonic()
+        self._entries.move_to_end(key)
+
+    async def put(self, key: str, client: TelegramClient):
+        async with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry["client"] is not client:
+                    await self._close(key, client)
+                return
+            now = time.monotonic()
+            self._entries[key] = {"client": client, "borrowed": 0, "last_used": now, "last_checked": now}
+            log.info("adopted", key=key, size=len(self._entries))
+        await self._evict_overflow()
+
+    async def check(self, key: str) -> bool | None:
+        async with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            client = entry["client"]
+            try:
+                if not client.is_connected():
+                    await timed_connect(client)
+                with stage("health_check"):
+                    me = await client.get_me(input_peer=True)
+            except Exception as e:
+                log.warning("health check failed", key=key, err=e)
+                return None
+            if me is None:
+                log.info("unauthorized", key=key)
+                self._entries.pop(key, None)
+                await self._close(key, client)
+                return False
+            entry["last_checked"] = time.monotonic()
+            return True
+
+    async def discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            await self._close(key, entry["client"])
+
+    def start(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        for key in list(self._entries):
+            await self.discard(key)
+
+    def _checkout(self, key: str, entry: dict):
+        entry["borrowed"] += 1
+        entry["last_used"] = time.monotonic()
+        self._entries.move_to_end(key)
+
+    async def _ensure_healthy(self, key: str, entry: dict) -> bool:
+        client = entry["client"]
+        now = time.monotonic()
+        try:
+            if not client.is_connected():
+                await timed_connect(client)
+                entry["last_checked"] = 0.0
+            if now - entry["last_checked"] >= self.health_interval:
+                with stage("health_check"):
+                    me = await client.get_me(input_peer=True)
+                if me is None:
+                    log.info("unauthorized", key=key)
+                    return False
+                entry["last_checked"] = now
+            return True
+        except Exception as e:
+            log.warning("health check failed", key=key, err=e)
+        try:
+            await client.disconnect()
+            await timed_connect(client)
+            if not await timed_is_authorized(client):
+                return False
+            entry["last_checked"] = time.monotonic()
+            log.info("reconnected", key=key)
+            return True
+        except Exception as e:
+            log.warning("reconnect failed", key=key, err=e)
+            return False
+
+    async def _evict_overflow(self):
+        while len(self._entries) > self.max_size:
+            victim = next((k for k, e in self._entries.items() if e["borrowed"] == 0), None)
+            if victim is None:
+                return
+            log.info("evict lru", key=victim)
+            await self.discard(victim)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                now = time.monotonic()
+                idle = [k for k, e in self._entries.items() if e["borrowed"] == 0 and now - e["last_used"] >= self.idle_timeout]
+                for key in idle:
+                    entry = self._entries.get(key)
+                    if entry is None or entry["borrowed"] > 0:
+                        continue
+                    log.info("evict idle", key=key)
+                    await self.discard(key)
+            except Exception as e:
+                log.exception("sweep error", err=e)
+
+    async def _close(self, key: str, client: TelegramClient):
+        try:
+            await client.disconnect()
+        except Exception as e:
+            log.warning("disconnect error", key=key, err=e)
@@ -0,0 +1,95 @@
+import os
+import bisect
+import hashlib
+import aiohttp
+
+from applog import get_logger
+
+log = get_logger("cluster")
+
+FORWARDED_HEADER = "X-CallMeJoe-Forwarded"
+PASSTHROUGH_HEADERS = ("Retry-After",)
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+def parse_nodes(spec: str) -> dict[str, str]:
+    nodes = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        node, url = item.split("=", 1)
+        nodes[node.strip()] = url.strip().rstrip("/")
+    return nodes
+
+class HashRing:
+    def __init__(self, nodes: list[str], vnodes: int = 128):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self._keys = [p for p, _ in points]
+        self._nodes = [n for _, n in points]
+
+    def owner(self, key: str) -> str:
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[i]
+
+class Cluster:
+    def __init__(self, node_id: str, nodes: dict[str, str], vnodes: int = 128, timeout: float = 30.0):
+        if node_id not in nodes:
+            raise ValueError(f"WORKER_ID {node_id!r} is not listed in CLUSTER_NODES")
+        self.node_id = node_id
+        self.nodes = nodes
+        self.ring = HashRing(sorted(nodes), vnodes)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session: aiohttp.ClientSession | None = None
+
+    @classmethod
+    def from_env(cls) -> "Cluster":
+        node_id = os.getenv("WORKER_ID", "local")
+        nodes = parse_nodes(os.getenv("CLUSTER_NODES", "")) or {node_id: ""}
+        return cls(node_id, nodes, vnodes=int(os.getenv("CLUSTER_VNODES", "128")), timeout=float(os.getenv("CLUSTER_FORWARD_TIMEOUT", "30")))
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.nodes) > 1
+
+    def owner(self, number: str) -> str:
+        if not self.enabled:
+            return self.node_id
+        return self.ring.owner(number.strip())
+
+    def owns(self, number: str) -> bool:
+        return self.owner(number) == self.node_id
+
+    def partition(self, numbers: list[str]) -> dict[str, list[str]]:
+        groups: dict[str, list[str]] = {}
+        for number in numbers:
+            groups.setdefault(self.owner(number), []).append(number)
+        return groups
+
+    def peers(self) -> list[str]:
+        return [node for node in self.nodes if node != self.node_id]
+
+    def _get_sess(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        return self._session
+
+    async def forward(self, node: str, method: str, path: str, query: str = "", body: bytes | None = None, content_type: str | None = None) -> tuple[int, bytes, str, dict[str, str]]:
+        url = self.nodes[node] + path + (f"?{query}" if query else "")
+        headers = {FORWARDED_HEADER: self.node_id}
+        if content_type:
+            headers["Content-Type"] = content_type
+        async with self._get_sess().request(method, url, data=body, headers=headers) as r:
+            headers = {name: r.headers[name] for name in PASSTHROUGH_HEADERS if name in r.headers}
+            return r.status, await r.read(), r.content_type, headers
+
+    async def call(self, node: str, method: str, path: str, params: dict | None = None, payload: dict | None = None) -> tuple[int, dict | None]:
+        url = self.nodes[node] + path
+        async with self._get_sess().request(method, url, params=params, json=payload, headers={FORWARDED_HEADER: self.node_id}) as r:
+            data = await r.json(content_type=None)
+            log.debug("peer call", node=node, path=path, status=r.status)
+            return r.status, data
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
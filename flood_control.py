@@ -0,0 +1,125 @@
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from telethon.errors import FloodWaitError
+
+from applog import get_logger
+from metrics import REGISTRY
+
+log = get_logger("flood_control")
+
+FLOOD_EVENTS = REGISTRY.counter("callmejoe_flood_events_total", "Telegram requests delayed or refused by flood control.", ["method", "reason"])
+
+METHOD_CLASSES = {
+    "send_code_request": "auth",
+    "sign_in": "auth",
+    "sign_in_2fa": "auth",
+    "get_me": "get_me",
+    "get_entity": "resolve",
+}
+
+DEFAULT_LIMITS = {
+    "auth": (0.2, 3.0),
+    "get_me": (1.0, 5.0),
+    "resolve": (0.5, 5.0),
+}
+
+def parse_limits(spec: str) -> dict[str, tuple[float, float]]:
+    limits = dict(DEFAULT_LIMITS)
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        rate, _, burst = value.partition("/")
+        limits[name.strip()] = (float(rate), float(burst or 1))
+    return limits
+
+class FloodWait(Exception):
+    def __init__(self, method: str, retry_after: int):
+        super().__init__(f"flood wait {retry_after}s on {method}")
+        self.method = method
+        self.retry_after = retry_after
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+class FloodControl:
+    def __init__(self, limits: dict[str, tuple[float, float]] | None = None, max_delay: float = 2.0):
+        self.limits = limits if limits is not None else dict(DEFAULT_LIMITS)
+        self.max_delay = max_delay
+        self._buckets: dict[tuple[str, str], TokenBucket] = {}
+        self._blocked: dict[tuple[str, str], float] = {}
+
+    def _class(self, method: str) -> str:
+        return METHOD_CLASSES.get(method, method)
+
+    def blocked_for(self, key: str, method: str) -> float:
+        slot = (key, self._class(method))
+        until = self._blocked.get(slot)
+        if until is None:
+            return 0.0
+        left = until - time.monotonic()
+        if left <= 0:
+            self._blocked.pop(slot, None)
+            return 0.0
+        return left
+
+    def blocked_count(self) -> int:
+        now = time.monotonic()
+        return sum(1 for until in self._blocked.values() if until > now)
+
+    def record(self, key: str, method: str, seconds: float):
+        slot = (key, self._class(method))
+        until = time.monotonic() + seconds
+        self._blocked[slot] = max(until, self._blocked.get(slot, 0.0))
+        FLOOD_EVENTS.inc(method=method, reason="flood_wait")
+        log.warning("flood wait", key=key, method=method, seconds=seconds)
+
+    def _bucket(self, slot: tuple[str, str]) -> TokenBucket | None:
+        bucket = self._buckets.get(slot)
+        if bucket is None:
+            limit = self.limits.get(slot[1])
+            if limit is None:
+                return None
+            bucket = self._buckets[slot] = TokenBucket(*limit)
+        return bucket
+
+    def check(self, key: str, method: str):
+        left = self.blocked_for(key, method)
+        if left > 0:
+            FLOOD_EVENTS.inc(method=method, reason="blocked")
+            raise FloodWait(method, math.ceil(left))
+
+    @asynccontextmanager
+    async def guard(self, key: str, method: str):
+        self.check(key, method)
+        bucket = self._bucket((key, self._class(method)))
+        if bucket is not None:
+            delay = bucket.reserve()
+            if delay > self.max_delay:
+                bucket.refund()
+                FLOOD_EVENTS.inc(method=method, reason="throttled")
+                raise FloodWait(method, math.ceil(delay))
+            if delay > 0:
+                FLOOD_EVENTS.inc(method=method, reason="delayed")
+                await asyncio.sleep(delay)
+        try:
+            yield
+        except FloodWaitError as e:
+            self.record(key, method, e.seconds)
+            raise FloodWait(method, e.seconds) from e
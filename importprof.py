@@ -0,0 +1,60 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+def profile(module: str) -> dict:
+    env = {**os.environ, "LOG_LEVEL": os.getenv("LOG_LEVEL", "CRITICAL")}
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - t0) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}")
+    packages: dict[str, dict] = {}
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m is None:
+            continue
+        self_us, cumulative_us, indent, name = int(m.group(1)), int(m.group(2)), len(m.group(3)), m.group(4)
+        top = name.split(".")[0]
+        pkg = packages.setdefault(top, {"self_ms": 0.0, "cumulative_ms": 0.0, "modules": 0})
+        pkg["self_ms"] += self_us / 1000
+        pkg["modules"] += 1
+        if indent == 1 or name == top:
+            pkg["cumulative_ms"] = max(pkg["cumulative_ms"], cumulative_us / 1000)
+    total_ms = sum(p["self_ms"] for p in packages.values())
+    return {
+        "module": module,
+        "wall_ms": round(wall_ms, 1),
+        "import_ms": round(total_ms, 1),
+        "packages": {name: {k: round(v, 1) if isinstance(v, float) else v for k, v in p.items()} for name, p in sorted(packages.items(), key=lambda it: -it[1]["self_ms"])},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Report import-time cost of a module using python -X importtime.")
+    parser.add_argument("module", nargs="?", default="api")
+    parser.add_argument("--top", type=int, default=15, help="packages to show in the text report")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args()
+
+    report = profile(args.module)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"import {report['module']}: {report['import_ms']} ms in imports, {report['wall_ms']} ms wall (interpreter start included)")
+    print(f"{'package':<28} {'self ms':>10} {'cumul ms':>10} {'modules':>8}")
+    for name, p in list(report["packages"].items())[:args.top]:
+        print(f"{name:<28} {p['self_ms']:>10} {p['cumulative_ms']:>10} {p['modules']:>8}")
+    if "pytgcalls" in report["packages"] or "ntgcalls" in report["packages"]:
+        print("warning: pytgcalls/ntgcalls are imported eagerly")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import re
+import time
+from collections import OrderedDict
+from telethon import TelegramClient
+from telethon.tl.types import InputPeerUser, InputPeerChat, InputPeerChannel
+
+from applog import get_logger
+from account_manager import AccountManager
+from metrics import stage
+
+log = get_logger("peer_cache")
+
+_LINK_RE = re.compile(r"^(?:https?://)?(?:www\.)?(?:t|telegram)\.me/", re.IGNORECASE)
+
+def normalize_target(target: str) -> str:
+    key = _LINK_RE.sub("", target.strip())
+    return key.lstrip("@").rstrip("/").lower()
+
+def _dump_peer(peer) -> dict | None:
+    if isinstance(peer, InputPeerUser):
+        return {"type": "user", "id": peer.user_id, "access_hash": peer.access_hash}
+    if isinstance(peer, InputPeerChannel):
+        return {"type": "channel", "id": peer.channel_id, "access_hash": peer.access_hash}
+    if isinstance(peer, InputPeerChat):
+        return {"type": "chat", "id": peer.chat_id}
+    return None
+
+def _load_peer(data: dict):
+    if data["type"] == "user":
+        return InputPeerUser(user_id=data["id"], access_hash=data["access_hash"])
+    if data["type"] == "channel":
+        return InputPeerChannel(channel_id=data["id"], access_hash=data["access_hash"])
+    return InputPeerChat(chat_id=data["id"])
+
+def _remember(client: TelegramClient, peer):
+    try:
+        client.session.process_entities([peer])
+    except Exception as e:
+        log.warning("session seed error", err=e)
+
+class PeerCache:
+    FILE_NAME = "peers.json"
+
+    def __init__(self, manager: AccountManager, ttl: float = 86400.0, max_size: int = 256):
+        self._manager = manager
+        self.ttl = ttl
+        self.max_size = max_size
+        self._accounts: dict[str, OrderedDict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _entries(self, number: str) -> OrderedDict:
+        entries = self._accounts.get(number)
+        if entries is None:
+            entries = OrderedDict()
+            try:
+                stored = self._manager.read_json(number, self.FILE_NAME) or []
+            except Exception as e:
+                log.warning("load error", number=number, err=e)
+                stored = []
+            for item in stored:
+                entries[item["key"]] = item
+            self._accounts[number] = entries
+        return entries
+
+    def _persist(self, number: str):
+        try:
+            self._manager.write_json(number, self.FILE_NAME, list(self._entries(number).values()))
+        except Exception as e:
+            log.warning("persist error", number=number, err=e)
+
+    def get(self, number: str, target: str):
+        key = normalize_target(target)
+        entries = self._entries(number)
+        item = entries.get(key)
+        if item is None:
+            return None
+        if time.time() - item["resolved_at"] >= self.ttl:
+            entries.pop(key, None)
+            return None
+        entries.move_to_end(key)
+        return _load_peer(item["peer"])
+
+    def put(self, number: str, target: str, peer):
+        dumped = _dump_peer(peer)
+        if dumped is None:
+            return
+        key = normalize_target(target)
+        entries = self._entries(number)
+        entries[key] = {"key": key, "peer": dumped, "resolved_at": time.time()}
+        entries.move_to_end(key)
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+        self._persist(number)
+
+    def invalidate(self, number: str, target: str):
+        if self._entries(number).pop(normalize_target(target), None) is not None:
+            self._persist(number)
+
+    async def resolve(self, number: str, client: TelegramClient, target: str):
+        peer = self.get(number, target)
+        if peer is not None:
+            self.hits += 1
+            _remember(client, peer)
+            return peer
+        self.misses += 1
+        async with self._manager.flood.guard(number, "get_entity"):
+            with stage("get_entity"):
+                peer = await client.get_input_entity(target)
+        self.put(number, target, peer)
+        log.info("resolved", number=number, target=normalize_target(target))
+        return peer
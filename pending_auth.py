@@ -0,0 +1,72 @@
+import time
+from collections import OrderedDict
+
+from applog import get_logger
+from metrics import REGISTRY
+
+log = get_logger("pending_auth")
+
+EVICTIONS = REGISTRY.counter("callmejoe_pending_auth_evictions_total", "Pending logins dropped before they finished.", ["reason"])
+
+class PendingAuth:
+    def __init__(self, ttl: float = 600.0, max_size: int = 256, remember: int = 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.remember = remember
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._expired: "OrderedDict[str, float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, phone: str) -> bool:
+        return phone in self._entries
+
+    def get(self, phone: str) -> dict | None:
+        return self._entries.get(phone)
+
+    def values(self) -> list[dict]:
+        return list(self._entries.values())
+
+    def put(self, phone: str, entry: dict) -> list[tuple[str, dict]]:
+        entry["expires_at"] = time.monotonic() + self.ttl
+        self._entries[phone] = entry
+        self._entries.move_to_end(phone)
+        self._expired.pop(phone, None)
+        evicted = []
+        while len(self._entries) > self.max_size:
+            victim, old = self._entries.popitem(last=False)
+            self._mark(victim, "capacity")
+            evicted.append((victim, old))
+        return evicted
+
+    def pop(self, phone: str) -> dict | None:
+        return self._entries.pop(phone, None)
+
+    def due(self) -> list[str]:
+        now = time.monotonic()
+        phones = []
+        for phone, entry in self._entries.items():
+            if entry["expires_at"] > now:
+                break
+            phones.append(phone)
+        return phones
+
+    def expire(self, phone: str) -> dict | None:
+        entry = self._entries.get(phone)
+        if entry is None or entry["expires_at"] > time.monotonic():
+            return None
+        del self._entries[phone]
+        self._mark(phone, "ttl")
+        return entry
+
+    def was_expired(self, phone: str) -> bool:
+        return self._expired.pop(phone, None) is not None
+
+    def _mark(self, phone: str, reason: str):
+        EVICTIONS.inc(reason=reason)
+        log.info("evicted", phone=phone, reason=reason)
+        self._expired[phone] = time.time()
+        self._expired.move_to_end(phone)
+        while len(self._expired) > self.remember:
+            self._expired.popitem(last=False)
@@ -0,0 +1,162 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from applog import get_logger
+from account_manager import AccountManager
+
+log = get_logger("profile_cache")
+
+class ProfileCache:
+    def __init__(self, manager: AccountManager, probe: Callable[[str], Awaitable[dict]], ttl: float = 300.0, timeout: float = 5.0, refresh_interval: float = 30.0, refresh_concurrency: int = 4, owns: Callable[[str], bool] | None = None, peer_ttl: float = 5.0):
+        self._manager = manager
+        self._probe = probe
+        self.ttl = ttl
+        self.timeout = timeout
+        self.refresh_interval = refresh_interval
+        self.refresh_concurrency = refresh_concurrency
+        self._owns = owns or (lambda number: True)
+        self.peer_ttl = peer_ttl
+        self._peer_entries: dict[str, tuple[float, dict | None]] = {}
+        self._entries: dict[str, dict] = {}
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._refresher: asyncio.Task | None = None
+
+    def load(self):
+        for number, _ in self._manager.list_accounts():
+            if self._owns(number):
+                self._load_one(number)
+        log.info("loaded", entries=len(self._entries))
+
+    def _load_one(self, number: str) -> dict | None:
+        entry = self._read(number)
+        if entry is not None:
+            self._entries[number] = entry
+        return entry
+
+    def _read(self, number: str) -> dict | None:
+        meta = self._manager.read_meta(number, "PROFILE")
+        if not meta or not meta.get("checked_at"):
+            return None
+        return {
+            "number": number,
+            "authorized": meta.get("authorized") == "yes",
+            "username": meta.get("username") or None,
+            "first_name": meta.get("first_name") or None,
+            "checked_at": float(meta["checked_at"]),
+        }
+
+    def _peer_entry(self, number: str) -> dict | None:
+        cached = self._peer_entries.get(number)
+        now = time.monotonic()
+        if cached is None or now - cached[0] >= self.peer_ttl:
+            cached = (now, self._read(number))
+            self._peer_entries[number] = cached
+        return cached[1]
+
+    def _view(self, entry: dict) -> dict:
+        return {**entry, "stale": time.time() - entry["checked_at"] >= self.ttl}
+
+    def get(self, number: str) -> dict | None:
+        if not self._owns(number):
+            entry = self._peer_entry(number)
+        else:
+            entry = self._entries.get(number) or self._load_one(number)
+        return None if entry is None else self._view(entry)
+
+    def fallback(self, number: str, err: str) -> dict:
+        entry = self._entries.get(number)
+        if entry is not None:
+            return {**entry, "stale": True, "error": err}
+        return {"number": number, "authorized": None, "username": None, "first_name": None, "checked_at": None, "stale": True, "error": err}
+
+    def invalidate(self, number: str):
+        self._entries.pop(number, None)
+        self._peer_entries.pop(number, None)
+        meta = self._manager.read_meta(number, "PROFILE")
+        if meta and meta.get("checked_at"):
+            self._manager.write_meta(number, "PROFILE", {**meta, "checked_at": ""})
+
+    def mark_authorized(self, number: str) -> dict:
+        previous = self._entries.get(number) or self._load_one(number) or {}
+        entry = {
+            "number": number,
+            "authorized": True,
+            "username": previous.get("username"),
+            "first_name": previous.get("first_name"),
+            "checked_at": time.time() - self.ttl,
+        }
+        self._store(number, entry)
+        return self._view(entry)
+
+    async def refresh(self, number: str) -> dict:
+        task = self._inflight.get(number)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(number))
+            self._inflight[number] = task
+            task.add_done_callback(lambda _: self._inflight.pop(number, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, number: str) -> dict:
+        try:
+            info = await asyncio.wait_for(self._probe(number), self.timeout)
+        except Exception as e:
+            err = "timeout" if isinstance(e, asyncio.TimeoutError) else str(e)
+            log.warning("refresh failed", number=number, err=err)
+            return self.fallback(number, err)
+        entry = {
+            "number": number,
+            "authorized": bool(info.get("authorized")),
+            "username": info.get("username"),
+            "first_name": info.get("first_name"),
+            "checked_at": time.time(),
+        }
+        self._store(number, entry)
+        return self._view(entry)
+
+    def _store(self, number: str, entry: dict):
+        persisted = self._manager.write_meta(number, "PROFILE", {
+            "authorized": "yes" if entry["authorized"] else "no",
+            "username": entry["username"],
+            "first_name": entry["first_name"],
+            "checked_at": f"{entry['checked_at']:.3f}",
+        })
+        if persisted:
+            self._entries[number] = entry
+
+    def start(self):
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def close(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+    async def _refresh_loop(self):
+        sem = asyncio.Semaphore(self.refresh_concurrency)
+
+        async def refresh_one(number: str):
+            async with sem:
+                await self.refresh(number)
+
+        while True:
+            try:
+                now = time.time()
+                due = []
+                for number, _ in self._manager.list_accounts():
+                    if not self._owns(number):
+                        continue
+                    entry = self._entries.get(number)
+                    if entry is None or now - entry["checked_at"] >= self.ttl:
+                        due.append(number)
+                if due:
+                    log.info("background refresh", due=len(due))
+                    await asyncio.gather(*(refresh_one(n) for n in due))
+            except Exception as e:
+                log.exception("refresh loop error", err=e)
+            await asyncio.sleep(self.refresh_interval)
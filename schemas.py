@@ -0,0 +1,97 @@
+from pydantic import BaseModel, ConfigDict
+
+class APIModel(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+class InitNewRequest(APIModel):
+    number: str
+
+class EnterCodeRequest(APIModel):
+    number: str
+    code: str
+
+class Enter2FARequest(APIModel):
+    number: str
+    password: str
+
+class InfoBatchRequest(APIModel):
+    numbers: list[str]
+    refresh: bool = False
+
+class CallStartRequest(APIModel):
+    number: str
+    username: str
+
+class CallScheduleRequest(APIModel):
+    number: str
+    username: str
+    at: float | None = None
+    delay: float = 0.0
+
+class CallCancelRequest(APIModel):
+    id: str
+
+class AuthResult(APIModel):
+    status: str
+    number: str | None = None
+    retry_after: int | None = None
+    detail: str | None = None
+
+class SessionEntry(APIModel):
+    number: str
+    authorized: bool | None = None
+    username: str | None = None
+    first_name: str | None = None
+    checked_at: float | None = None
+    stale: bool = False
+    error: str | None = None
+
+class SessionsList(APIModel):
+    sessions: list[SessionEntry]
+
+class SessionInfo(SessionEntry):
+    status: str
+
+class SessionsBatch(APIModel):
+    status: str
+    sessions: list[SessionEntry] = []
+    max: int | None = None
+
+class CallJob(APIModel):
+    model_config = ConfigDict(extra="allow")
+    id: str
+    number: str
+    username: str
+    at: float
+    created_at: float
+    status: str
+
+class CallStartResult(APIModel):
+    status: str
+    number: str | None = None
+    to: str | None = None
+    ring_ms: float | None = None
+    retry_after: int | None = None
+    detail: str | None = None
+
+class CallScheduleResult(APIModel):
+    status: str
+    job: CallJob | None = None
+    number: str | None = None
+    retry_after: int | None = None
+    detail: str | None = None
+
+class CallCancelResult(APIModel):
+    status: str
+    job: CallJob | None = None
+    id: str | None = None
+    detail: str | None = None
+
+class ScheduledCall(APIModel):
+    status: str
+    job: CallJob | None = None
+    id: str | None = None
+
+class ScheduledCalls(APIModel):
+    status: str
+    jobs: list[CallJob]
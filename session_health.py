@@ -0,0 +1,140 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from applog import get_logger
+from account_manager import AccountManager
+from metrics import REGISTRY
+
+log = get_logger("session_health")
+
+CHECKS = REGISTRY.counter("callmejoe_session_health_checks_total", "Background session authorization checks by result.", ["result"])
+REVOKED = REGISTRY.counter("callmejoe_sessions_revoked_total", "Sessions found deauthorized by the background validator.", [])
+
+class SessionHealth:
+    SECTION = "HEALTH"
+
+    def __init__(self, manager: AccountManager, interval: float = 600.0, batch_size: int = 10, batch_delay: float = 5.0, timeout: float = 10.0, owns: Callable[[str], bool] | None = None, on_revoked: Callable[[str], Awaitable[None]] | None = None, peer_ttl: float = 5.0):
+        self._manager = manager
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.timeout = timeout
+        self._owns = owns or (lambda number: True)
+        self._on_revoked = on_revoked
+        self.peer_ttl = peer_ttl
+        self._peer_entries: dict[str, tuple[float, dict | None]] = {}
+        self._entries: dict[str, dict] = {}
+        self._task: asyncio.Task | None = None
+
+    def load(self):
+        for number, _ in self._manager.list_accounts():
+            if self._owns(number):
+                self._load_one(number)
+        log.info("loaded", entries=len(self._entries))
+
+    def _load_one(self, number: str) -> dict | None:
+        entry = self._read(number)
+        if entry is not None:
+            self._entries[number] = entry
+        return entry
+
+    def _read(self, number: str) -> dict | None:
+        meta = self._manager.read_meta(number, self.SECTION)
+        if not meta or not meta.get("checked_at"):
+            return None
+        return {
+            "authorized": meta.get("authorized") == "yes",
+            "checked_at": float(meta["checked_at"]),
+            "revoked_at": float(meta["revoked_at"]) if meta.get("revoked_at") else None,
+        }
+
+    def _peer_entry(self, number: str) -> dict | None:
+        cached = self._peer_entries.get(number)
+        now = time.monotonic()
+        if cached is None or now - cached[0] >= self.peer_ttl:
+            cached = (now, self._read(number))
+            self._peer_entries[number] = cached
+        return cached[1]
+
+    def get(self, number: str) -> dict | None:
+        if not self._owns(number):
+            return self._peer_entry(number)
+        return self._entries.get(number) or self._load_one(number)
+
+    def authorized_count(self) -> int:
+        return sum(1 for entry in self._entries.values() if entry["authorized"])
+
+    async def check(self, number: str) -> dict | None:
+        try:
+            authorized = await asyncio.wait_for(self._manager.check_authorized(number), self.timeout)
+        except Exception as e:
+            CHECKS.inc(result="error")
+            log.warning("check failed", number=number, err="timeout" if isinstance(e, asyncio.TimeoutError) else e)
+            return None
+        if authorized is None:
+            CHECKS.inc(result="skipped")
+            return None
+        CHECKS.inc(result="authorized" if authorized else "unauthorized")
+        return await self.record(number, authorized)
+
+    async def record(self, number: str, authorized: bool) -> dict:
+        previous = self.get(number)
+        now = time.time()
+        revoked = not authorized and previous is not None and previous["authorized"]
+        entry = {
+            "authorized": authorized,
+            "checked_at": now,
+            "revoked_at": now if revoked else (None if authorized or previous is None else previous["revoked_at"]),
+        }
+        self._manager.write_meta(number, self.SECTION, {
+            "authorized": "yes" if authorized else "no",
+            "checked_at": f"{now:.3f}",
+            "revoked_at": "" if entry["revoked_at"] is None else f"{entry['revoked_at']:.3f}",
+        })
+        self._entries[number] = entry
+        if revoked:
+            REVOKED.inc()
+            log.warning("session revoked", number=number)
+            if self._on_revoked is not None:
+                try:
+                    await self._on_revoked(number)
+                except Exception as e:
+                    log.warning("revoked hook failed", number=number, err=e)
+        return entry
+
+    async def run_once(self) -> int:
+        numbers = [number for number, _ in self._manager.list_accounts() if self._owns(number)]
+        numbers.sort(key=lambda n: (self.get(n) or {}).get("checked_at", 0.0))
+        checked = 0
+        for i in range(0, len(numbers), self.batch_size):
+            if i:
+                await asyncio.sleep(self.batch_delay)
+            results = await asyncio.gather(*(self.check(n) for n in numbers[i:i + self.batch_size]))
+            checked += sum(1 for r in results if r is not None)
+        log.info("pass done", sessions=len(numbers), checked=checked)
+        return checked
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.run_once()
+            except Exception as e:
+                log.exception("health loop error", err=e)
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
@@ -0,0 +1,79 @@
+import os
+import configparser
+
+from applog import get_logger
+
+log = get_logger("session_index")
+
+class SessionIndex:
+    def __init__(self, sessions_dir: str):
+        self.sessions_dir = sessions_dir
+        self._by_phone: dict[str, str] = {}
+        self._next_idx = 1
+        self._mtime_ns: int | None = None
+
+    def _dir_mtime(self) -> int | None:
+        try:
+            return os.stat(self.sessions_dir).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def invalidate(self):
+        self._mtime_ns = None
+
+    def refresh(self, force: bool = False):
+        mtime = self._dir_mtime()
+        if not force and mtime is not None and mtime == self._mtime_ns:
+            return
+        self._rebuild()
+        self._mtime_ns = mtime
+
+    def _rebuild(self):
+        by_phone = {}
+        max_idx = 0
+        names = sorted(os.listdir(self.sessions_dir)) if os.path.isdir(self.sessions_dir) else []
+        for name in names:
+            p = os.path.join(self.sessions_dir, name)
+            if not os.path.isdir(p):
+                continue
+            if name.startswith("Session_") and name[len("Session_"):].isdigit():
+                max_idx = max(max_idx, int(name[len("Session_"):]))
+            info_path = os.path.join(p, "info.ini")
+            if not os.path.exists(info_path):
+                continue
+            cfg = configparser.ConfigParser()
+            cfg.read(info_path, encoding="utf-8")
+            acc = cfg.get("ACCOUNT_INFO", "acc_number", fallback=None)
+            if acc and acc.strip():
+                by_phone.setdefault(acc.strip(), p)
+        self._by_phone = by_phone
+        self._next_idx = max_idx + 1
+        log.info("rebuilt", accounts=len(by_phone), next_idx=self._next_idx)
+
+    def get(self, phone: str) -> str | None:
+        self.refresh()
+        return self._by_phone.get(phone.strip())
+
+    def items(self) -> list[tuple[str, str]]:
+        self.refresh()
+        return sorted(self._by_phone.items(), key=lambda it: os.path.basename(it[1]))
+
+    def allocate(self, phone: str) -> str:
+        self.refresh()
+        idx = self._next_idx
+        while True:
+            name = f"Session_{idx}"
+            path = os.path.join(self.sessions_dir, name)
+            try:
+                os.makedirs(path)
+            except FileExistsError:
+                idx += 1
+                continue
+            cfg = configparser.ConfigParser()
+            cfg["ACCOUNT_INFO"] = {"acc_number": phone, "session_dir": name}
+            with open(os.path.join(path, "info.ini"), "w", encoding="utf-8") as f:
+                cfg.write(f)
+            self._by_phone[phone.strip()] = path
+            self._next_idx = idx + 1
+            self._mtime_ns = self._dir_mtime()
+            return path
@@ -0,0 +1,362 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import configparser
+from abc import ABC, abstractmethod
+from telethon.crypto import AuthKey
+from telethon.sessions import MemorySession
+
+from applog import get_logger, setup_logging
+from session_index import SessionIndex
+
+log = get_logger("session_store")
+
+class SessionStore(ABC):
+    @abstractmethod
+    def items(self) -> list[tuple[str, str]]:
+        ...
+
+    @abstractmethod
+    def get(self, phone: str) -> str | None:
+        ...
+
+    @abstractmethod
+    def allocate(self, phone: str) -> str:
+        ...
+
+    @abstractmethod
+    def read_meta(self, phone: str, section: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def write_meta(self, phone: str, section: str, values: dict) -> bool:
+        ...
+
+    @abstractmethod
+    def read_json(self, phone: str, name: str):
+        ...
+
+    @abstractmethod
+    def write_json(self, phone: str, name: str, data) -> bool:
+        ...
+
+    @abstractmethod
+    def telethon_session(self, phone: str):
+        ...
+
+    def close(self):
+        pass
+
+class DirectoryStore(SessionStore):
+    def __init__(self, sessions_dir: str):
+        self.sessions_dir = sessions_dir
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        self.index = SessionIndex(self.sessions_dir)
+        self.index.refresh(force=True)
+
+    def items(self) -> list[tuple[str, str]]:
+        return self.index.items()
+
+    def get(self, phone: str) -> str | None:
+        return self.index.get(phone)
+
+    def allocate(self, phone: str) -> str:
+        return self.index.allocate(phone)
+
+    def read_meta(self, phone: str, section: str) -> dict | None:
+        session_dir = self.get(phone)
+        if session_dir is None:
+            return None
+        cfg = configparser.ConfigParser()
+        cfg.read(os.path.join(session_dir, "info.ini"), encoding="utf-8")
+        if not cfg.has_section(section):
+            return None
+        return dict(cfg.items(section))
+
+    def write_meta(self, phone: str, section: str, values: dict) -> bool:
+        session_dir = self.get(phone)
+        if session_dir is None:
+            return False
+        info_path = os.path.join(session_dir, "info.ini")
+        cfg = configparser.ConfigParser()
+        cfg.read(info_path, encoding="utf-8")
+        cfg[section] = {k: "" if v is None else str(v) for k, v in values.items()}
+        tmp_path = info_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            cfg.write(f)
+        os.replace(tmp_path, info_path)
+        return True
+
+    def read_json(self, phone: str, name: str):
+        session_dir = self.get(phone)
+        if session_dir is None:
+            return None
+        path = os.path.join(session_dir, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_json(self, phone: str, name: str, data) -> bool:
+        session_dir = self.get(phone)
+        if session_dir is None:
+            return False
+        path = os.path.join(session_dir, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return True
+
+    def telethon_session(self, phone: str) -> str | None:
+        session_dir = self.get(phone)
+        if session_dir is None:
+            return None
+        return os.path.join(session_dir, "telethon.session")
+
+class StoreSession(MemorySession):
+    def __init__(self, store: "SQLiteStore", phone: str):
+        super().__init__()
+        self._store = store
+        self.phone = phone
+        row = store.load_auth(phone)
+        if row is not None:
+            dc_id, server_address, port, auth_key, takeout_id = row
+            self._dc_id = dc_id or 0
+            self._server_address = server_address
+            self._port = port
+            self._auth_key = AuthKey(data=auth_key) if auth_key else None
+            self._takeout_id = takeout_id
+        self._entities = set(store.load_entities(phone))
+
+    def process_entities(self, tlo):
+        rows = set(self._entities_to_rows(tlo)) - self._entities
+        if rows:
+            self._entities |= rows
+            self._store.save_entities(self.phone, rows)
+
+    def set_dc(self, dc_id, server_address, port):
+        super().set_dc(dc_id, server_address, port)
+        self.save()
+
+    @property
+    def auth_key(self):
+        return self._auth_key
+
+    @auth_key.setter
+    def auth_key(self, value):
+        self._auth_key = value
+        self.save()
+
+    @property
+    def takeout_id(self):
+        return self._takeout_id
+
+    @takeout_id.setter
+    def takeout_id(self, value):
+        self._takeout_id = value
+        self.save()
+
+    def save(self):
+        key = self._auth_key.key if self._auth_key else None
+        self._store.save_auth(self.phone, self._dc_id, self._server_address, self._port, key, self._takeout_id)
+
+    def delete(self):
+        self._store.delete_auth(self.phone)
+
+class SQLiteStore(SessionStore):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS accounts (phone TEXT PRIMARY KEY, idx INTEGER NOT NULL UNIQUE, created_at REAL NOT NULL);
+    CREATE TABLE IF NOT EXISTS meta (phone TEXT NOT NULL, section TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (phone, section, key));
+    CREATE TABLE IF NOT EXISTS documents (phone TEXT NOT NULL, name TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (phone, name));
+    CREATE TABLE IF NOT EXISTS telethon_sessions (phone TEXT PRIMARY KEY, dc_id INTEGER, server_address TEXT, port INTEGER, auth_key BLOB, takeout_id INTEGER);
+    CREATE TABLE IF NOT EXISTS telethon_entities (phone TEXT NOT NULL, id INTEGER NOT NULL, hash INTEGER NOT NULL, username TEXT, phone_number TEXT, name TEXT, PRIMARY KEY (phone, id));
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+        self._by_phone: dict[str, int] = dict(self._db.execute("SELECT phone, idx FROM accounts"))
+        log.info("opened", path=path, accounts=len(self._by_phone))
+
+    @staticmethod
+    def _name(idx: int) -> str:
+        return f"Session_{idx}"
+
+    def _lookup(self, phone: str) -> int | None:
+        phone = phone.strip()
+        idx = self._by_phone.get(phone)
+        if idx is None:
+            row = self._db.execute("SELECT idx FROM accounts WHERE phone = ?", (phone,)).fetchone()
+            if row is not None:
+                idx = self._by_phone[phone] = row[0]
+        return idx
+
+    def items(self) -> list[tuple[str, str]]:
+        rows = self._db.execute("SELECT phone, idx FROM accounts ORDER BY idx").fetchall()
+        self._by_phone = dict(rows)
+        return [(phone, self._name(idx)) for phone, idx in rows]
+
+    def get(self, phone: str) -> str | None:
+        idx = self._lookup(phone)
+        return None if idx is None else self._name(idx)
+
+    def allocate(self, phone: str, idx: int | None = None) -> str:
+        phone = phone.strip()
+        for wanted in ([idx] if idx is not None else []) + [None]:
+            try:
+                with self._db:
+                    if wanted is None:
+                        self._db.execute("INSERT INTO accounts (phone, idx, created_at) SELECT ?, COALESCE(MAX(idx), 0) + 1, ? FROM accounts", (phone, time.time()))
+                    else:
+                        self._db.execute("INSERT INTO accounts (phone, idx, created_at) VALUES (?, ?, ?)", (phone, wanted, time.time()))
+                    new_idx = self._db.execute("SELECT idx FROM accounts WHERE phone = ?", (phone,)).fetchone()[0]
+                    self._replace_section(phone, "ACCOUNT_INFO", {"acc_number": phone, "session_dir": self._name(new_idx)})
+            except sqlite3.IntegrityError:
+                existing = self._lookup(phone)
+                if existing is not None:
+                    return self._name(existing)
+                continue
+            self._by_phone[phone] = new_idx
+            return self._name(new_idx)
+        raise RuntimeError(f"could not allocate a session index for {phone}")
+
+    def read_meta(self, phone: str, section: str) -> dict | None:
+        rows = self._db.execute("SELECT key, value FROM meta WHERE phone = ? AND section = ?", (phone.strip(), section)).fetchall()
+        return dict(rows) if rows else None
+
+    def _replace_section(self, phone: str, section: str, values: dict):
+        self._db.execute("DELETE FROM meta WHERE phone = ? AND section = ?", (phone, section))
+        self._db.executemany(
+            "INSERT INTO meta (phone, section, key, value) VALUES (?, ?, ?, ?)",
+            [(phone, section, k.lower(), "" if v is None else str(v)) for k, v in values.items()]
+        )
+
+    def write_meta(self, phone: str, section: str, values: dict) -> bool:
+        phone = phone.strip()
+        if self._lookup(phone) is None:
+            return False
+        with self._db:
+            self._replace_section(phone, section, values)
+        return True
+
+    def read_json(self, phone: str, name: str):
+        row = self._db.execute("SELECT data FROM documents WHERE phone = ? AND name = ?", (phone.strip(), name)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def write_json(self, phone: str, name: str, data) -> bool:
+        phone = phone.strip()
+        if self._lookup(phone) is None:
+            return False
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO documents (phone, name, data) VALUES (?, ?, ?)", (phone, name, json.dumps(data, ensure_ascii=False)))
+        return True
+
+    def load_auth(self, phone: str) -> tuple | None:
+        return self._db.execute("SELECT dc_id, server_address, port, auth_key, takeout_id FROM telethon_sessions WHERE phone = ?", (phone.strip(),)).fetchone()
+
+    def save_auth(self, phone: str, dc_id: int, server_address: str | None, port: int | None, auth_key: bytes | None, takeout_id: int | None):
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO telethon_sessions (phone, dc_id, server_address, port, auth_key, takeout_id) VALUES (?, ?, ?, ?, ?, ?)",
+                (phone.strip(), dc_id, server_address, port, auth_key, takeout_id)
+            )
+
+    def delete_auth(self, phone: str):
+        with self._db:
+            self._db.execute("DELETE FROM telethon_sessions WHERE phone = ?", (phone.strip(),))
+            self._db.execute("DELETE FROM telethon_entities WHERE phone = ?", (phone.strip(),))
+
+    def load_entities(self, phone: str) -> list[tuple]:
+        return self._db.execute("SELECT id, hash, username, phone_number, name FROM telethon_entities WHERE phone = ?", (phone.strip(),)).fetchall()
+
+    def save_entities(self, phone: str, rows):
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO telethon_entities (phone, id, hash, username, phone_number, name) VALUES (?, ?, ?, ?, ?, ?)",
+                [(phone.strip(), *row) for row in rows]
+            )
+
+    def telethon_session(self, phone: str) -> StoreSession | None:
+        if self._lookup(phone) is None:
+            return None
+        return StoreSession(self, phone.strip())
+
+    def close(self):
+        self._db.close()
+
+def open_store(kind: str, sessions_dir: str, db_path: str) -> SessionStore:
+    if kind == "sqlite":
+        return SQLiteStore(db_path)
+    if kind == "dir":
+        return DirectoryStore(sessions_dir)
+    raise ValueError(f"unknown session store: {kind}")
+
+def _read_telethon_file(path: str) -> tuple | None:
+    if not os.path.exists(path):
+        return None
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return db.execute("SELECT dc_id, server_address, port, auth_key, takeout_id FROM sessions").fetchone()
+    except sqlite3.OperationalError:
+        row = db.execute("SELECT dc_id, server_address, port, auth_key FROM sessions").fetchone()
+        return None if row is None else (*row, None)
+    finally:
+        db.close()
+
+def _read_telethon_entities(path: str) -> list[tuple]:
+    if not os.path.exists(path):
+        return []
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return db.execute("SELECT id, hash, username, phone, name FROM entities").fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        db.close()
+
+def migrate(sessions_dir: str, db_path: str) -> int:
+    src = DirectoryStore(sessions_dir)
+    dst = SQLiteStore(db_path)
+    moved = 0
+    try:
+        for phone, session_dir in src.items():
+            if dst.get(phone) is not None:
+                log.info("migrate skip", phone=phone, reason="exists")
+                continue
+            name = os.path.basename(session_dir)
+            suffix = name[len("Session_"):]
+            dst.allocate(phone, idx=int(suffix) if name.startswith("Session_") and suffix.isdigit() else None)
+            cfg = configparser.ConfigParser()
+            cfg.read(os.path.join(session_dir, "info.ini"), encoding="utf-8")
+            for section in cfg.sections():
+                if section != "ACCOUNT_INFO":
+                    dst.write_meta(phone, section, dict(cfg.items(section)))
+            for fname in sorted(os.listdir(session_dir)):
+                if fname.endswith(".json"):
+                    with open(os.path.join(session_dir, fname), "r", encoding="utf-8") as f:
+                        dst.write_json(phone, fname, json.load(f))
+            auth = _read_telethon_file(os.path.join(session_dir, "telethon.session"))
+            if auth is not None:
+                dst.save_auth(phone, *auth)
+            entities = _read_telethon_entities(os.path.join(session_dir, "telethon.session"))
+            if entities:
+                dst.save_entities(phone, entities)
+            moved += 1
+            log.info("migrated", phone=phone, session=name, auth=auth is not None, entities=len(entities))
+    finally:
+        dst.close()
+    return moved
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy the sessions/Session_N layout into a single SQLite session store.")
+    parser.add_argument("--sessions-dir", default="sessions")
+    parser.add_argument("--db", default="sessions.db")
+    args = parser.parse_args()
+    setup_logging()
+    print(f"migrated {migrate(args.sessions_dir, args.db)} account(s) into {args.db}")
@@ -0,0 +1,27 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FAKE_LATENCY_MS = 20.0
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    pytest.importorskip("telethon")
+    import bench
+    import account_manager
+    from flood_control import FloodControl
+
+    monkeypatch.setattr(account_manager, "TelegramClient", bench.FakeTelegramClient)
+    monkeypatch.setattr(bench.FAKE, "latency_ms", FAKE_LATENCY_MS)
+    monkeypatch.setattr(bench.FAKE, "jitter_ms", 0.0)
+    monkeypatch.setattr(bench.FAKE, "failure_rate", 0.0)
+    bench.AUTHORIZED.clear()
+    bench.TWOFA.clear()
+    yield account_manager.AccountManager(
+        sessions_dir=str(tmp_path / "sessions"), api_id=1, api_hash="x", device_model="test", system_version="test",
+        app_version="test", lang_code="en", system_lang_code="en", flood=FloodControl({})
+    )
+    bench.AUTHORIZED.clear()
+    bench.TWOFA.clear()
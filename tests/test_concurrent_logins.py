@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+
+pytest.importorskip("telethon")
+
+import bench
+from account_manager import AccountManager
+
+async def _login(manager: AccountManager, phone: str) -> str:
+    res = await manager.init_new(phone)
+    if res["status"] != "code_sent":
+        return res["status"]
+    res = await manager.enter_code(phone, bench.FAKE_CODE)
+    if res["status"] == "2fa_required":
+        res = await manager.enter_2fa(phone, bench.FAKE_PASSWORD)
+    return res["status"]
+
+def _assert_no_locks(manager: AccountManager):
+    assert manager._locks == {}
+    assert manager.pool._locks == {}
+
+def test_parallel_logins_for_different_numbers_do_not_serialize(manager, monkeypatch):
+    sign_in = bench.FakeTelegramClient.sign_in
+    active: dict[str, int] = {}
+    peak = {"all": 0, "per_phone": 0}
+
+    async def tracked_sign_in(self, *args, **kwargs):
+        active[self.session_path] = active.get(self.session_path, 0) + 1
+        peak["all"] = max(peak["all"], sum(active.values()))
+        peak["per_phone"] = max(peak["per_phone"], active[self.session_path])
+        try:
+            return await sign_in(self, *args, **kwargs)
+        finally:
+            active[self.session_path] -= 1
+
+    monkeypatch.setattr(bench.FakeTelegramClient, "sign_in", tracked_sign_in)
+
+    async def run():
+        phones = [f"+1555{i:07d}" for i in range(100)]
+        for phone in phones[::4]:
+            bench.TWOFA.add(phone)
+        results = await asyncio.wait_for(asyncio.gather(*(_login(manager, p) for p in phones)), 30)
+
+        assert results == ["authorized"] * len(phones)
+        assert peak["all"] >= len(phones) // 2
+        assert peak["per_phone"] == 1
+        assert manager.pending_count() == 0
+        _assert_no_locks(manager)
+        await manager.close()
+    asyncio.run(run())
+
+def test_parallel_steps_for_one_number_are_serialized_without_deadlock(manager):
+    phone = "+15550000000"
+
+    async def run():
+        sent = await asyncio.wait_for(asyncio.gather(*(manager.init_new(phone) for _ in range(20))), 30)
+        assert {r["status"] for r in sent} == {"code_sent"}
+        assert manager.pending_count() == 1
+
+        entered = await asyncio.wait_for(asyncio.gather(*(manager.enter_code(phone, bench.FAKE_CODE) for _ in range(20))), 30)
+        statuses = [r["status"] for r in entered]
+        assert statuses.count("authorized") == 1
+        assert statuses.count("already_authorized") == 19
+        assert manager.pending_count() == 0
+        _assert_no_locks(manager)
+        await manager.close()
+    asyncio.run(run())
+
+def test_mixed_numbers_and_repeats(manager):
+    phones = [f"+1777{i:07d}" for i in range(10)]
+
+    async def run():
+        flows = [_login(manager, phone) for phone in phones for _ in range(5)]
+        results = await asyncio.wait_for(asyncio.gather(*flows), 30)
+        assert set(results) <= {"authorized", "already_authorized", "code_invalid", "expired"}
+        for phone in phones:
+            assert phone in manager.pool
+        _assert_no_locks(manager)
+        await manager.close()
+    asyncio.run(run())
+
+def test_failed_connects_leave_no_pending_logins(manager, monkeypatch):
+    clients = []
+    new_client = manager._new_client
+
+    def tracked(phone):
+        client = new_client(phone)
+        clients.append(client)
+        return client
+
+    async def broken_send_code(self, phone):
+        raise ConnectionError("fake send_code_request failure")
+
+    monkeypatch.setattr(manager, "_new_client", tracked)
+
+    async def run():
+        monkeypatch.setattr(bench.FakeTelegramClient, "send_code_request", broken_send_code)
+        assert (await manager.init_new("+15551110000"))["status"] == "error"
+
+        phones = [f"+1555222{i:04d}" for i in range(10)]
+        for phone in phones:
+            manager.store.allocate(phone)
+        monkeypatch.setattr(bench.FAKE, "failure_rate", 1.0)
+        results = await asyncio.gather(*(manager.enter_code(phone, bench.FAKE_CODE) for phone in phones))
+        assert {r["status"] for r in results} == {"error"}
+
+        assert manager.pending_count() == 0
+        assert not any(client.is_connected() for client in clients)
+        _assert_no_locks(manager)
+        await manager.close()
+    asyncio.run(run())
+
+def test_capacity_eviction_drops_shared_auth_state(manager):
+    phones = [f"+1555444{i:04d}" for i in range(3)]
+    manager._pending.max_size = 2
+
+    async def run():
+        for phone in phones:
+            assert (await manager.init_new(phone))["status"] == "code_sent"
+        assert manager.pending_count() == 2
+        assert manager.registry.get_auth(phones[0]) is None
+        assert all(manager.registry.get_auth(phone) is not None for phone in phones[1:])
+        assert (await manager.enter_code(phones[0], bench.FAKE_CODE))["status"] == "expired"
+        await manager.close()
+    asyncio.run(run())
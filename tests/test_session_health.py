@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+
+pytest.importorskip("telethon")
+
+import bench
+from account_manager import AccountManager
+from session_health import SessionHealth
+
+PHONE = "+15553330000"
+
+async def _authorize(manager: AccountManager):
+    assert (await manager.init_new(PHONE))["status"] == "code_sent"
+    assert (await manager.enter_code(PHONE, bench.FAKE_CODE))["status"] == "authorized"
+
+def test_connection_errors_do_not_revoke(manager, monkeypatch):
+    revoked = []
+
+    async def on_revoked(number):
+        revoked.append(number)
+
+    health = SessionHealth(manager, on_revoked=on_revoked)
+
+    async def run():
+        await _authorize(manager)
+        assert (await health.check(PHONE))["authorized"] is True
+
+        monkeypatch.setattr(bench.FAKE, "failure_rate", 1.0)
+        assert await health.check(PHONE) is None
+        await manager.pool.discard(PHONE)
+        assert await health.check(PHONE) is None
+        assert health.get(PHONE)["authorized"] is True
+        assert revoked == []
+
+        monkeypatch.setattr(bench.FAKE, "failure_rate", 0.0)
+        manager.release_client(PHONE, await manager.get_client(PHONE))
+        assert PHONE in manager.pool
+        bench.AUTHORIZED.clear()
+        entry = await health.check(PHONE)
+        assert entry["authorized"] is False and entry["revoked_at"] is not None
+        assert revoked == [PHONE]
+        assert PHONE not in manager.pool
+        await manager.close()
+    asyncio.run(run())